@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .ingest import StandingsBuilder
+from .models import Language, Monitor, MonitorArchive, Problem, StandingsCell, Submit
+from .monitor_gen import MonitorGenerator
+
+
+class MonitorArchiver:
+    """Moves the submits of an old monitor out of the hot tables into one compressed MonitorArchive row and back.
+    The archive keeps the final table, which MonitorGenerator shows, and every submit, so nothing is lost"""
+
+    # languages by name, so an archive does not depend on the ids of Language rows
+    SUBMIT_FIELDS = ['index', 'problem_id', 'personality_id', 'submission_time', 'is_contest', 'verdict', 'test_no',
+                     'language__name', 'max_time']
+    CHUNK_SIZE = 2000
+
+    class ContestsLeased(Exception):
+        """A worker is writing the contests of the monitor, so its submits can not be archived now"""
+
+    @staticmethod
+    def _submits(monitor: Monitor):
+        return Submit.objects.filter(contest__monitor=monitor)
+
+    @classmethod
+    def archive(cls, monitor: Monitor) -> MonitorArchive or None:
+        """None when the monitor is still updated or already archived,
+        raises ContestsLeased when a worker is writing its contests"""
+        if not monitor.is_old or MonitorArchive.objects.filter(monitor=monitor).exists():
+            return None
+
+        with transaction.atomic():
+            contests = list(monitor.contest_set.select_for_update())
+            if any(contest.is_leased() for contest in contests):
+                raise cls.ContestsLeased()
+
+            table = MonitorGenerator.read_table(monitor)
+            submits = [
+                [index, problem, personality, time.isoformat(), *values]
+                for index, problem, personality, time, *values in
+                cls._submits(monitor).order_by('pk').values_list(*cls.SUBMIT_FIELDS).iterator(chunk_size=cls.CHUNK_SIZE)
+            ]
+            archive = MonitorArchive(monitor=monitor, submits=len(submits))
+            archive.pack({
+                'cells': [[*key, *cell.__getstate__()] for key, cell in table.items()],
+                'submits': submits,
+                # attempts summary ingest counted without keeping their submits
+                'pruned': list(StandingsCell.objects.filter(problem__contest__monitor=monitor, pruned__gt=0)
+                               .values_list('problem_id', 'personality_id', 'pruned', 'pruned_until')),
+            })
+            archive.save()
+
+            StandingsCell.objects.filter(problem__contest__monitor=monitor).delete()
+            cls._submits(monitor).delete()
+        MonitorGenerator.refresh(monitor)
+        return archive
+
+    @classmethod
+    def rehydrate(cls, monitor: Monitor) -> int:
+        """Puts the archived submits back and rebuilds their standings cells, returns the number of submits"""
+        archive = MonitorArchive.objects.filter(monitor=monitor).first()
+        if archive is None:
+            return 0
+
+        with transaction.atomic():
+            # submits of contests deleted since archiving have nowhere to go
+            contests = dict(Problem.objects.filter(contest__monitor=monitor).values_list('pk', 'contest_id'))
+            payload = archive.unpack()
+            rows = [dict(zip(cls.SUBMIT_FIELDS, values)) for values in payload['submits']]
+            rows = [row for row in rows if row['problem_id'] in contests]
+            languages = Language.get_ids({row['language__name'] for row in rows} - {None})
+
+            submits = []
+            for row in rows:
+                language = row.pop('language__name')
+                submits.append(Submit(
+                    contest_id=contests[row['problem_id']],
+                    language_id=languages.get(language),
+                    **dict(row, submission_time=timezone.datetime.fromisoformat(row['submission_time']))
+                ))
+            Submit.objects.bulk_create(submits, batch_size=cls.CHUNK_SIZE)
+            StandingsCell.objects.bulk_create([
+                StandingsCell(problem_id=problem, personality_id=personality, pruned=pruned, pruned_until=until)
+                for problem, personality, pruned, until in payload.get('pruned', []) if problem in contests
+            ], batch_size=cls.CHUNK_SIZE)
+
+            pairs = list({(submit.problem_id, submit.personality_id) for submit in submits})
+            for start in range(0, len(pairs), cls.CHUNK_SIZE):
+                StandingsBuilder.rebuild(set(pairs[start:start + cls.CHUNK_SIZE]))
+            archive.delete()
+        MonitorGenerator.refresh(monitor)
+        return len(submits)
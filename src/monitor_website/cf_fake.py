@@ -0,0 +1,135 @@
+import io
+import json
+import random
+import time
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+
+class FakeContest:
+    """Codeforces data of one contest, recorded with `manage.py record_cf_fixture` or generated"""
+
+    VERDICTS = ['OK', 'WRONG_ANSWER', 'TIME_LIMIT_EXCEEDED', 'RUNTIME_ERROR', 'COMPILATION_ERROR']
+    START_TIME = 1660000000
+
+    def __init__(self, contest_id, standings: dict, status: list[dict], participants=100, seed=0):
+        self.contest_id = contest_id
+        self.standings = standings
+        self.status = status  # newest first, like contest.status returns it
+        self.participants = participants
+        self._random = random.Random(seed)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            fixture = json.load(f)
+        return cls(fixture['contest_id'], fixture['standings'], fixture['status'])
+
+    def dump(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'contest_id': self.contest_id, 'standings': self.standings, 'status': self.status}, f)
+
+    @classmethod
+    def generate(cls, submissions=1000, participants=100, problems=10, contest_id=1, seed=0):
+        problem_list = [{'index': chr(ord('A') + i), 'name': f'Задача {i + 1}', 'rating': 800 + 100 * i}
+                        for i in range(problems)]
+        standings = {'contest': {'id': contest_id, 'name': f'Контест {contest_id}'}, 'problems': problem_list}
+        fake = cls(contest_id, standings, [], participants, seed)
+        fake.add_submissions(submissions)
+        return fake
+
+    def add_submissions(self, count, testing=0):
+        """Appends `count` new submissions, the last `testing` of them still being tested"""
+        first_id = self.status[0]['id'] + 1 if self.status else 1
+        problems = self.standings['problems']
+        for i in range(count):
+            submission_id = first_id + i
+            submission = {
+                'id': submission_id,
+                'contestId': self.contest_id,
+                'creationTimeSeconds': self.START_TIME + submission_id,
+                'problem': self._random.choice(problems),
+                'author': {
+                    'participantType': self._random.choice(['CONTESTANT', 'PRACTICE']),
+                    'members': [{'handle': f'user{self._random.randrange(self.participants)}'}]
+                },
+                'programmingLanguage': self._random.choice(['GNU C++17', 'Python 3', 'PyPy 3']),
+                'testset': 'TESTS',
+                'passedTestCount': self._random.randrange(30),
+                'timeConsumedMillis': self._random.randrange(2000),
+                'memoryConsumedBytes': self._random.randrange(1 << 28),
+            }
+            if i < count - testing:
+                submission['verdict'] = self._random.choice(self.VERDICTS)
+            else:
+                submission['verdict'] = 'TESTING'
+            self.status.insert(0, submission)
+
+    def judge(self):
+        """Finishes testing of all pending submissions"""
+        for submission in self.status:
+            if submission.get('verdict', 'TESTING') == 'TESTING':
+                submission['verdict'] = self._random.choice(self.VERDICTS)
+
+
+class FakeCodeforcesAdapter(requests.adapters.BaseAdapter):
+    """Transport answering Codeforces API calls from a FakeContest, mount it on CodeforcesAPIManager.session.
+    Can add latency and inject rate limit replies, unavailable service pages and connection errors"""
+
+    def __init__(self, contest: FakeContest, latency=0., rate_limit_rate=0., error_rate=0., connection_error_rate=0.,
+                 seed=0):
+        super().__init__()
+        self.contest = contest
+        self.contests = {str(contest.contest_id): contest}  # add more to serve several contests by contestId
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.connection_error_rate = connection_error_rate
+        self.calls = 0
+        self.queries: list[(str, dict)] = []  # method names and parameters of the answered calls
+        self.replies: list[requests.Response] = []
+        self._random = random.Random(seed)
+
+    def _reply(self, request, status_code, body: bytes, content_type='application/json'):
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers['Content-Type'] = content_type
+        response.raw = io.BytesIO(body)
+        response.url = request.url
+        response.request = request
+        self.replies.append(response)
+        return response
+
+    def _get_result(self, query_name, params: dict):
+        contest = self.contests.get(params.get('contestId'), self.contest)
+        if query_name == 'contest.standings':
+            return contest.standings
+        if query_name == 'contest.status':
+            start = int(params.get('from', 1)) - 1
+            count = int(params.get('count', len(contest.status)))
+            return contest.status[start:start + count]
+        return None
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self._random.random() < self.connection_error_rate:
+            raise requests.exceptions.ConnectionError('Injected connection error', request=request)
+        if self._random.random() < self.error_rate:
+            return self._reply(request, 503, b'<html>Codeforces is temporarily unavailable</html>', 'text/html')
+        if self._random.random() < self.rate_limit_rate:
+            return self._reply(request, 503, b'{"status":"FAILED","comment":"Call limit exceeded"}')
+
+        url = urlparse(request.url)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        query_name = url.path.rsplit('/', 1)[-1]
+        self.queries.append((query_name, params))
+        result = self._get_result(query_name, params)
+        if result is None:
+            return self._reply(request, 400, b'{"status":"FAILED","comment":"Unknown method"}')
+        return self._reply(request, 200, json.dumps({'status': 'OK', 'result': result}).encode())
+
+    def close(self):
+        pass
@@ -1,17 +1,29 @@
+import json
+import multiprocessing
 import os
+import queue
 import random
+import socket
+import sys
 import threading
 import time
 import requests
-from hashlib import sha512
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import closing
+from hashlib import sha1, sha512
 import monitor_website.models as models
+from monitor_website.ingest import IngestContext, SubmissionBatch, UnknownProblemError
+from monitor_website.json_stream import JsonArrayStream
+from monitor_website.scheduler import ContestScheduler
 import datetime
 import pytz
 # from selenium import webdriver
 # import chromedriver_binary
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
-from django.db.utils import OperationalError
-from django.db.models import F
+from django.db.utils import DatabaseError, OperationalError
+from django.db.models import Case, Q, Value, When
 
 
 class WorkerError(IOError):
@@ -34,9 +46,79 @@ class WorkerContestError(WorkerError):
     """Problem with contest initialization"""
 
 
+class TokenBucket:
+    """Lets through `rate` calls per second on average and bursts of up to `capacity` calls"""
+
+    def __init__(self, rate: float, capacity: float = 1, shared=False):
+        """Shared bucket keeps its state in shared memory, so it limits all processes forked after its creation"""
+        self.rate = rate
+        self.capacity = capacity
+        if shared:
+            self._state = multiprocessing.Array('d', [capacity, time.monotonic()])
+            self._lock = self._state.get_lock()
+        else:
+            self._state = [capacity, time.monotonic()]
+            self._lock = threading.Lock()
+
+    def acquire(self):
+        """Takes a token, sleeping until it is earned if the bucket is in debt"""
+        with self._lock:
+            tokens, last = self._state
+            now = time.monotonic()
+            tokens = min(self.capacity, tokens + (now - last) * self.rate) - 1
+            self._state[0], self._state[1] = tokens, now
+            delay = -tokens / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _make_session(pool_size) -> requests.Session:
+    """Keep-alive session reused by all fetcher threads, so TLS handshakes are paid once per connection"""
+    session = requests.Session()
+    session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    session.headers.update({
+        'Accept-Encoding': 'gzip, deflate',
+        'Connection': 'keep-alive'
+    })
+    return session
+
+
 class CodeforcesAPIManager:
     API_KEY = os.environ.get('WORKER_KEY')
     SECRET = os.environ.get('WORKER_SECRET')
+    RATE = float(os.environ.get('WORKER_RATE', '0.5'))
+    BURST = float(os.environ.get('WORKER_BURST', '1'))
+    POOL_SIZE = int(os.environ.get('WORKER_THREADS', '4'))
+    STREAM_CHUNK_SIZE = 64 * 1024
+    TIMEOUT = (
+        float(os.environ.get('WORKER_CONNECT_TIMEOUT', '5')),
+        float(os.environ.get('WORKER_READ_TIMEOUT', '60'))
+    )
+
+    class CallStats:
+        """API calls made for one contest, added to its counters when the worker releases it"""
+
+        def __init__(self):
+            self.calls = 0
+            self.seconds = 0.
+            self.wire_bytes = 0
+            self.body_bytes = 0
+
+        def add(self, seconds, wire_bytes, body_bytes):
+            self.calls += 1
+            self.seconds += seconds
+            self.wire_bytes += wire_bytes
+            self.body_bytes += body_bytes
+
+        def save_to(self, contest: models.Contest) -> list[str]:
+            contest.api_calls += self.calls
+            contest.api_seconds += self.seconds
+            contest.api_wire_bytes += self.wire_bytes
+            contest.api_body_bytes += self.body_bytes
+            return ['api_calls', 'api_seconds', 'api_wire_bytes', 'api_body_bytes']
+
+    bucket = TokenBucket(RATE, BURST)
+    session = _make_session(POOL_SIZE)
 
     @classmethod
     def _get_apisig(cls, func_name, params: dict):
@@ -47,24 +129,61 @@ class CodeforcesAPIManager:
         hsh = sha512(s.encode('ascii')).hexdigest()
         return f"{rnd}{hsh}"
 
+    @staticmethod
+    def _account(stats: CallStats, seconds, result: requests.Response, body_bytes):
+        if stats is None:
+            return
+        wire_bytes = result.raw.tell() or int(result.headers.get('Content-Length', body_bytes))
+        stats.add(seconds, wire_bytes, body_bytes)
+
     @classmethod
-    def get_cf_query(cls, cid, query_name) -> dict:
-        """Can raise RequestException or CodeforcesAPI"""
+    def _get_params(cls, cid, query_name, extra: dict) -> dict:
+        """Waits for the rate limiter, so the signature time is fresh"""
+        cls.bucket.acquire()
         params = {
             "apiKey": f"{cls.API_KEY}",
             "contestId": f"{cid}",
             "time": f"{round(time.time())}",
-            "lang": "ru"
+            "lang": "ru",
+            **{key: f"{value}" for key, value in extra.items()}
         }
         params["apiSig"] = cls._get_apisig(query_name, params)
+        return params
+
+    @classmethod
+    def get_cf_query(cls, cid, query_name, stats: CallStats = None, **extra) -> dict:
+        """Can raise RequestException or CodeforcesAPI"""
+        params = cls._get_params(cid, query_name, extra)
 
         try:
-            time.sleep(3)
-            result = requests.get(f"https://codeforces.com/api/{query_name}", params)
+            started = time.monotonic()
+            result = cls.session.get(f"https://codeforces.com/api/{query_name}", params=params, timeout=cls.TIMEOUT)
+            cls._account(stats, time.monotonic() - started, result, len(result.content))
             return result.json()
         except requests.exceptions.JSONDecodeError:
             raise CodeforcesAPIError(comment="Codeforces services unavailable")
 
+    @classmethod
+    def stream_cf_query(cls, cid, query_name, stats: CallStats = None, **extra):
+        """Yields items of the result list while the response is still downloading.
+        Can raise RequestException or CodeforcesAPI"""
+        params = cls._get_params(cid, query_name, extra)
+
+        started = time.monotonic()
+        with cls.session.get(f"https://codeforces.com/api/{query_name}", params=params, timeout=cls.TIMEOUT,
+                             stream=True) as result:
+            body = JsonArrayStream(result.iter_content(cls.STREAM_CHUNK_SIZE), 'result')
+            try:
+                yield from body
+            except ValueError:
+                raise CodeforcesAPIError(comment="Codeforces services unavailable")
+            finally:
+                cls._account(stats, time.monotonic() - started, result, body.size)
+
+            if not body.found:
+                comment = body.document.get('comment', 'Unknown problem') if isinstance(body.document, dict) else None
+                raise CodeforcesAPIError(comment=comment or 'Unknown problem')
+
 
 class CodeforcesGroupManager:
     CF_USER = 'cmw'
@@ -78,17 +197,19 @@ class CodeforcesGroupManager:
 class CodeforcesWorker:
     _instance = None
 
-    class Log:
-        def __init__(self, comment, style=""):
-            self.time = timezone.now()
-            self.comment = comment
-            self.style = style
+    @staticmethod
+    def get_name():
+        return f"{socket.gethostname()}:{os.getpid()}"
 
     @classmethod
     def log(cls, comment, style=""):
-        CodeforcesWorker.worker_logs.append(cls.Log(comment, style))
-        if len(CodeforcesWorker.worker_logs) > CodeforcesWorker.MAX_LOGS:
-            CodeforcesWorker.worker_logs.pop(0)
+        """Logs are kept in the database, so they are visible from the web processes"""
+        try:
+            log = models.WorkerLog.objects.create(worker=cls.get_name(), comment=comment, style=style)
+            if log.pk % cls.TRIM_LOGS_EVERY == 0:
+                models.WorkerLog.objects.filter(pk__lte=log.pk - cls.MAX_LOGS).delete()
+        except DatabaseError:
+            print(f'{timezone.now()} {cls.get_name()}: {comment}', file=sys.stderr)
 
     class Status:
         def __init__(self, contest=None, comment=""):
@@ -99,16 +220,82 @@ class CodeforcesWorker:
     @classmethod
     def set_status(cls, contest=None, comment=""):
         cls.current_status = cls.Status(contest, comment)
+        if contest is not None:
+            cls.contest_statuses[contest.pk] = cls.current_status
+
+    @classmethod
+    def clear_status(cls, contest):
+        cls.contest_statuses.pop(contest.pk, None)
+        if cls.current_status.contest == contest:
+            cls.set_status()
+
+    @classmethod
+    def get_status(cls, contest):
+        return cls.contest_statuses.get(contest.pk, cls.Status())
+
+    class Fetch:
+        """Codeforces data of one contest, downloaded by a fetcher thread without touching the database"""
+
+        def __init__(self, contest, with_problems, full_update, watermark, page_size):
+            self.contest = contest
+            self.with_problems = with_problems
+            self.full_update = full_update
+            self.watermark = watermark
+            self.page_size = page_size
+            self.problems = None
+            self.submissions = []
+            self.pages = None
+            self.closed = False
+            self.error = None
+            self.changed = 0
+            self.fingerprint = None
+            self.stats = CodeforcesAPIManager.CallStats()
+
+    class Watermark:
+        """Follows streamed submissions to find where the next incremental pass stops.
+        It stays below every submission that is still being tested, so its verdict is fetched again"""
+
+        def __init__(self):
+            self.pending = None
+            self.newest = None
+
+        def observe(self, submission: dict):
+            if submission.get('verdict', 'TESTING') == 'TESTING':
+                if self.pending is None or submission['id'] < self.pending['id']:
+                    self.pending = submission
+            if self.newest is None or submission['id'] > self.newest['id']:
+                self.newest = submission
+
+        def move(self, contest: models.Contest):
+            if self.pending is not None:
+                last = self.pending
+                contest.last_submission_id = last['id'] - 1
+            elif self.newest is not None:
+                last = self.newest
+                contest.last_submission_id = last['id']
+            else:
+                return
+
+            contest.last_submission_time = datetime.datetime.fromtimestamp(
+                last['creationTimeSeconds'],
+                pytz.timezone('utc')
+            )
 
     current_status = Status()
-    worker_logs = []
+    contest_statuses = {}
 
     MAX_LOGS = 500
+    TRIM_LOGS_EVERY = 50
     SUBMITS_QUERY = 'contest.status'
     PROBLEMS_QUERY = 'contest.standings'
-    SEARCH_NEW_STEP = 27
-    PING_DELTA = timezone.timedelta(minutes=20)
+    STATUS_PAGE_SIZE = 1000
+    MIN_PAGE_SIZE = 50
+    PAGE_QUEUE_SIZE = 4
+    FULL_UPDATE_DELTA = timezone.timedelta(hours=1)
+    PING_DELTA = ContestScheduler.PING_DELTA
     NAP_SECONDS = 10
+    LEASE_DELTA = timezone.timedelta(minutes=10)
+    FETCH_THREADS = CodeforcesAPIManager.POOL_SIZE
 
     VERDICTS = {
         'FAILED': 'FAIL',
@@ -129,13 +316,14 @@ class CodeforcesWorker:
 
     def __new__(cls, *args, **kwargs):
         if not isinstance(cls._instance, cls):
-            cls._instance = object.__new__(cls, *args, **kwargs)
+            cls._instance = object.__new__(cls)
         return cls._instance
 
-    def __init__(self):
-        self._iters = 100000
+    def __init__(self, embedded=True):
+        """Embedded worker runs in a thread of the web process, a standalone one is run by `manage.py run_worker`"""
+        self._iters = 100000 if embedded else float('inf')
 
-        if not hasattr(self, "_worker") or not self._worker.is_alive():
+        if embedded and (not hasattr(self, "_worker") or not self._worker.is_alive()):
             self._worker = threading.Thread(target=self.start)
             self._worker.start()
 
@@ -143,58 +331,32 @@ class CodeforcesWorker:
                 self.log('Воркер подняли из спячки.')
             else:
                 self.log('Воркер подняли из метрвых.', 'danger')
+        elif not embedded:
+            self.log('Воркер запущен отдельным процессом.')
 
     @staticmethod
-    def _get_query_result(contest: models.Contest, query):
-        status = CodeforcesAPIManager.get_cf_query(contest.cf_contest, query)
+    def _get_query_result(contest: models.Contest, query, stats=None, **extra):
+        status = CodeforcesAPIManager.get_cf_query(contest.cf_contest, query, stats, **extra)
         if 'status' not in status or status['status'] != 'OK' or 'result' not in status:
             raise CodeforcesAPIError(comment=status.get('comment', 'Unknown problem'))
         return status['result']
 
-    @staticmethod
-    def _find_problem(contest, sumbission_desc):
-        problem_q = contest.problem_set.filter(
-            index=f"{sumbission_desc['problem']['index']}",
-            name=f"{sumbission_desc['problem']['name']}",
-            contest=contest
-        )
-        if problem_q.count() != 1:
-            raise WorkerContestError()
-        return problem_q.first()
-
-    def _update_submission(self, contest: models.Contest, submission: dict):
-        res = False
-        for participant in submission['author']['members']:
-            personality, _ = models.Personality.objects.get_or_create(
-                monitor=contest.monitor,
-                nickname=participant['handle'],
-                defaults={
-                    'is_blacklisted': True
-                }
-            )
-
-            problem = self._find_problem(contest, submission)
-
-            _, is_new = models.Submit.objects.update_or_create(
-                index=f"{submission['id']}",
-                problem=problem,
-                personality=personality,
-                defaults={
-                    'submission_time': datetime.datetime.fromtimestamp(
-                        submission['creationTimeSeconds'],
-                        pytz.timezone('utc')
-                    ),
-                    'verdict':
-                        'NA' if 'verdict' not in submission or submission['verdict'] not in self.VERDICTS
-                        else self.VERDICTS[submission['verdict']],
-                    'test_no': None if 'passedTestCount' not in submission else submission['passedTestCount'] + 1,
-                    'is_contest': submission['author']['participantType'] == 'CONTESTANT',
-                    'language': submission['programmingLanguage'],
-                    'max_time': 0 if 'timeConsumedMillis' not in submission else submission['timeConsumedMillis']
-                }
-            )
-            res |= is_new
-        return res
+    @classmethod
+    def _submission_fields(cls, submission: dict) -> dict:
+        return {
+            'submission_time': datetime.datetime.fromtimestamp(
+                submission['creationTimeSeconds'],
+                pytz.timezone('utc')
+            ),
+            'verdict': models.Submit.VERDICT_CODES[
+                'NA' if 'verdict' not in submission or submission['verdict'] not in cls.VERDICTS
+                else cls.VERDICTS[submission['verdict']]
+            ],
+            'test_no': None if 'passedTestCount' not in submission else submission['passedTestCount'] + 1,
+            'is_contest': submission['author']['participantType'] == 'CONTESTANT',
+            'language': submission['programmingLanguage'],
+            'max_time': 0 if 'timeConsumedMillis' not in submission else submission['timeConsumedMillis']
+        }
 
     @staticmethod
     def _init_contest(contest: models.Contest, result: dict):
@@ -213,84 +375,317 @@ class CodeforcesWorker:
             contest.human_name = result['contest']['name']
         contest.save()
 
-    def _process_contest(self, contest: models.Contest, full_update=False):
-        try:
-            self.set_status(contest, 'Подготовка выгрузки...')
+    def _iter_new_submissions(self, contest: models.Contest, watermark: int, page_size: int, stats=None):
+        """contest.status returns the newest submissions first, so pages are streamed until the watermark is reached.
+        The page with the watermark is still read to the end, otherwise its keep-alive connection is dropped"""
+        page_from = 1
+        while True:
+            self.set_status(contest, f'Выгружаем посылки с {page_from}...')
+            read = 0
+            reached = False
+            with closing(CodeforcesAPIManager.stream_cf_query(contest.cf_contest, self.SUBMITS_QUERY, stats, **{
+                'from': page_from,
+                'count': page_size
+            })) as page:
+                for submission in page:
+                    read += 1
+                    reached |= submission['id'] <= watermark
+                    if not reached:
+                        yield submission
+
+            if reached or read < page_size:
+                return
+            page_from += page_size
+            page_size = self.STATUS_PAGE_SIZE
 
-            if contest.problem_set.count() == 0 or full_update:
-                self.set_status(contest, 'Выгружаем задачи...')
-                result = self._get_query_result(contest, self.PROBLEMS_QUERY)
-                self.set_status(contest, 'Записываем задачи...')
-                self._init_contest(contest, result)
+    @staticmethod
+    def _get_fingerprint(submissions: list[dict]) -> str:
+        """Identifies the submissions above the watermark, including verdicts of the ones still being tested"""
+        digest = sha1()
+        for submission in submissions:
+            digest.update(json.dumps(submission, sort_keys=True).encode())
+        max_id = max((submission['id'] for submission in submissions), default=0)
+        return f"{len(submissions)}:{max_id}:{digest.hexdigest()}"
+
+    def _plan_fetch(self, contest: models.Contest, full_update=False) -> Fetch:
+        with_problems = full_update or contest.problem_set.count() == 0
+        full_update |= contest.last_full_update is None or \
+            contest.last_full_update < timezone.now() - self.FULL_UPDATE_DELTA
+        watermark = 0 if full_update or contest.last_submission_id is None else contest.last_submission_id
+        return self.Fetch(contest, with_problems, full_update, watermark, self._get_page_size(contest, watermark))
+
+    @classmethod
+    def _get_page_size(cls, contest: models.Contest, watermark: int) -> int:
+        """The first page of an incremental pass is sized for the submissions expected since the last one,
+        so reading it to the end stays cheap"""
+        if watermark == 0 or contest.last_status_update is None:
+            return cls.STATUS_PAGE_SIZE
+        minutes = (timezone.now() - contest.last_status_update).total_seconds() / 60
+        return min(cls.STATUS_PAGE_SIZE, cls.MIN_PAGE_SIZE + round(2 * contest.submission_rate * minutes))
+
+    def _stream_pages(self, fetch: Fetch):
+        """Downloads a full pass into fetch.pages while the ingest thread writes the pages already read.
+        Runs in its own thread rather than in the pool, so blocked producers never starve the fetchers"""
+        def put(item) -> bool:
+            while not fetch.closed:
+                try:
+                    fetch.pages.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        page = []
+        try:
+            for submission in self._iter_new_submissions(fetch.contest, fetch.watermark, fetch.page_size,
+                                                         fetch.stats):
+                page.append(submission)
+                if len(page) >= fetch.page_size:
+                    if not put(page):
+                        return
+                    page = []
+            if put(page):
+                put(None)
+        except Exception as e:
+            put(e)
 
-            self.set_status(contest, 'Выгружаем посылки...')
-            result = self._get_query_result(contest, self.SUBMITS_QUERY)
+    @staticmethod
+    def _iter_pages(fetch: Fetch):
+        while True:
+            page = fetch.pages.get()
+            if page is None:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield from page
+
+    def _fetch(self, fetch: Fetch) -> Fetch:
+        """Runs in a fetcher thread. Can raise RequestException.
+        A full pass is only started here: its pages go through a bounded queue, so it never sits in memory"""
+        try:
+            if fetch.with_problems:
+                self.set_status(fetch.contest, 'Выгружаем задачи...')
+                fetch.problems = self._get_query_result(fetch.contest, self.PROBLEMS_QUERY, fetch.stats)
+            if fetch.full_update:
+                fetch.pages = queue.Queue(self.PAGE_QUEUE_SIZE)
+                threading.Thread(target=self._stream_pages, args=(fetch,), daemon=True).start()
+                fetch.submissions = self._iter_pages(fetch)
+            else:
+                fetch.submissions = list(
+                    self._iter_new_submissions(fetch.contest, fetch.watermark, fetch.page_size, fetch.stats)
+                )
+                if not fetch.with_problems:
+                    fetch.fingerprint = self._get_fingerprint(fetch.submissions)
+            self.set_status(fetch.contest, 'Ждем записи...')
+        except CodeforcesAPIError as e:
+            fetch.error = e
+        return fetch
 
-            start = max(0, len(result) - self.SEARCH_NEW_STEP)
+    def _process_contest(self, fetch: Fetch):
+        contest = fetch.contest
+        try:
+            if fetch.error is not None:
+                raise fetch.error
 
-            for s_ndx in range(0, len(result), self.SEARCH_NEW_STEP):
-                self.set_status(contest, f'Проверяем {s_ndx + 1}/{len(result)}')
-                if self._update_submission(contest, result[s_ndx]):
-                    start = min(start, max(0, s_ndx - self.SEARCH_NEW_STEP))
-                    break
+            if fetch.fingerprint is not None and fetch.fingerprint == contest.status_fingerprint:
+                contest.skipped_cycles += 1
+                contest.save(update_fields=['skipped_cycles'])
+                return
 
-            for i in range(start, len(result)):
-                self.set_status(contest, f'Обновляем {i + 1}/{len(result)}')
-                self._update_submission(contest, result[i])
+            if fetch.problems is not None:
+                self.set_status(contest, 'Записываем задачи...')
+                self._init_contest(contest, fetch.problems)
+
+            self.set_status(contest, 'Сверяем посылки...')
+            context = IngestContext(contest, since=None if fetch.watermark == 0 else contest.last_submission_time)
+            batch = SubmissionBatch(context)
+            watermark = self.Watermark()
+            for submission in fetch.submissions:
+                watermark.observe(submission)
+                batch.add(submission, self._submission_fields(submission))
+                if len(batch) >= batch.CHUNK_SIZE:
+                    self.set_status(contest, f'Записываем {len(batch)} посылок...')
+                    batch.flush()
+
+            self.set_status(contest, f'Записываем {len(batch)} посылок...')
+            batch.flush()
+            batch.prune()
+            fetch.changed = batch.inserted + batch.updated
+            if fetch.changed:
+                self.log(f'Контест "{contest.get_name()}": добавлено {batch.inserted}, обновлено {batch.updated} посылок')
+
+            watermark.move(contest)
+            contest.status_fingerprint = fetch.fingerprint or ''
+            contest.processed_cycles += 1
+            update_fields = ['last_submission_id', 'last_submission_time', 'status_fingerprint', 'processed_cycles']
+            if fetch.full_update:
+                contest.last_full_update = timezone.now()
+                update_fields.append('last_full_update')
+            contest.save(update_fields=update_fields)
 
         except CodeforcesAPIError as e:
             # TODO : call group cf api
             contest.set_error(e.comment)
             self.log(f'Проблема с контестом {contest.get_name()} ({contest.monitor.human_name}): {e.comment}', 'danger')
-        except WorkerContestError:
-            self._process_contest(contest, True)
+        except (WorkerContestError, UnknownProblemError):
+            fetch.closed = True
+            retry = self._plan_fetch(contest, True)
+            retry.stats = fetch.stats
+            self._fetch(retry)
+            self._process_contest(retry)
+            fetch.changed = retry.changed
+        finally:
+            fetch.closed = True
 
-    def start(self):
-        while self._iters > 0:
-            try:
-                contests_q = models.Contest.objects.filter(
-                    monitor__is_old=False,
-                    error_text__isnull=True,
-                    last_ping__gte=timezone.now() - self.PING_DELTA
-                )
+    @classmethod
+    def get_claimable(cls, now: datetime.datetime):
+        """Contests that are not leased and were viewed within PING_DELTA"""
+        return models.Contest.objects.filter(
+            Q(leased_until__isnull=True) | Q(leased_until__lt=now),
+            monitor__is_old=False,
+            error_text__isnull=True,
+            last_ping__gte=now - cls.PING_DELTA
+        ).select_related('monitor')
+
+    def _claim_contests(self, limit) -> list[models.Contest]:
+        """Leases the most urgent contests to this worker.
+        The plan is made on an unlocked read, then only the chosen rows are locked.
+        Rows locked by another worker's claim are skipped rather than waited for"""
+        now = timezone.now()
+        plans = [p for p in ContestScheduler.plan(list(self.get_claimable(now))) if p.is_due()]
+        chosen = [p.contest.pk for p in plans[:limit]]
+        if not chosen:
+            return []
+
+        with transaction.atomic():
+            rows = self.get_claimable(now).select_for_update(skip_locked=True, of=('self',)).filter(pk__in=chosen)
+            locked = {contest.pk: contest for contest in rows}
+            contests = [locked[pk] for pk in chosen if pk in locked]
+
+            for contest in contests:
+                contest.lease_owner = self.get_name()
+                contest.leased_until = now + self.LEASE_DELTA
+            models.Contest.objects.bulk_update(contests, ['lease_owner', 'leased_until'])
+        return contests
+
+    @staticmethod
+    def _release(contest: models.Contest, update_fields: list[str], stats=None):
+        if stats is not None:
+            update_fields = update_fields + stats.save_to(contest)
+        contest.lease_owner = ''
+        contest.leased_until = None
+        contest.save(update_fields=update_fields + ['lease_owner', 'leased_until'])
 
-                if contests_q.exists():
-                    contest = contests_q.order_by(F('last_status_update').asc(nulls_first=True)).first()
+    def start(self):
+        fetchers = ThreadPoolExecutor(self.FETCH_THREADS)
+        fetching = {}
+        try:
+            while self._iters > 0:
+                try:
+                    for contest in self._claim_contests(self.FETCH_THREADS - len(fetching)):
+                        self.log(f'Выбран контест "{contest.get_name()}" ({contest.monitor.human_name}) для обновления')
+                        self.set_status(contest, 'Подготовка выгрузки...')
+                        fetch = self._plan_fetch(contest)
+                        fetching[fetchers.submit(self._fetch, fetch)] = fetch
+
+                    if fetching:
+                        done, _ = wait(fetching, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            fetch = fetching.pop(future)
+                            contest = fetch.contest
+                            update_fields = ['fail_count']
+                            try:
+                                future.result()
+                                self._process_contest(fetch)
+
+                                now = timezone.now()
+                                ContestScheduler.observe(contest, fetch.changed, now)
+                                contest.last_status_update = now
+                                update_fields += ['last_status_update', 'submission_rate']
+                            except requests.exceptions.RequestException:
+                                contest.fail_count += 1
+                                raise
+                            finally:
+                                self.clear_status(contest)
+                                self._release(contest, update_fields, fetch.stats)
+                    else:
+                        self.log(f'Воркер не нашел работы и пошел спать')
+                        time.sleep(self.NAP_SECONDS)
+
+                except OperationalError:
+                    self.log('База данных умерла', 'danger')
+                    if self.current_status.contest:
+                        self.set_status(
+                            self.current_status.contest,
+                            'База данных не отвечает :(',
+                        )
 
-                    self.log(f'Выбран контест "{contest.get_name()}" ({contest.monitor.human_name}) для обновления')
-                    self._process_contest(contest)
+                    time.sleep(self.NAP_SECONDS)
+                except requests.exceptions.RequestException:
+                    self.log('Codeforces не доступен (как и интернет?)', 'danger')
+                    if self.current_status.contest:
+                        self.set_status(
+                            self.current_status.contest,
+                            'Codeforces не отвечает :(',
+                        )
 
-                    contest.last_status_update = timezone.now()
-                    self.set_status()
-                    contest.save(update_fields=['last_status_update'])
-                else:
-                    self.log(f'Воркер не нашел работы и пошел спать')
                     time.sleep(self.NAP_SECONDS)
 
-            except OperationalError:
-                self.log('База данных умерла', 'danger')
-                if self.current_status.contest:
-                    self.set_status(
-                        self.current_status.contest,
-                        'База данных не отвечает :(',
-                    )
+                self._iters -= 1
+        finally:
+            # the worker also gets here on SIGTERM, its leases are given back without waiting for LEASE_DELTA
+            fetchers.shutdown(wait=False, cancel_futures=True)
+            for fetch in fetching.values():
+                fetch.closed = True
+                try:
+                    self._release(fetch.contest, [], fetch.stats)
+                except DatabaseError:
+                    pass
+
+
+def wake_worker():
+    """Makes sure the embedded worker thread is alive, unless the worker runs as a standalone process"""
+    if settings.WORKER_EMBEDDED:
+        CodeforcesWorker()
 
-                time.sleep(self.NAP_SECONDS)
-            except requests.exceptions.RequestException:
-                self.log('Codeforces не доступен (как и интернет?)', 'danger')
-                if self.current_status.contest:
-                    self.set_status(
-                        self.current_status.contest,
-                        'Codeforces не отвечает :(',
-                    )
 
-                time.sleep(self.NAP_SECONDS)
+class PingBuffer:
+    """Last ping time of every monitor viewed in this process, written to its contests with one UPDATE.
+    A monitor that was not written for FLUSH_DELTA is written at once, together with everything pending,
+    later pings wait for the next such write. So last_ping is at most FLUSH_DELTA behind the real last view,
+    which is nothing against PING_DELTA of the worker"""
 
-            self._iters -= 1
+    FLUSH_DELTA = datetime.timedelta(seconds=30)
+
+    _lock = threading.Lock()
+    _pending: dict[int, datetime.datetime] = {}
+    _written: dict[int, datetime.datetime] = {}
+
+    @classmethod
+    def add(cls, monitor_id: int):
+        now = timezone.now()
+        with cls._lock:
+            cls._pending[monitor_id] = now
+            written = cls._written.get(monitor_id)
+            if written is not None and now - written < cls.FLUSH_DELTA:
+                return
+            pending, cls._pending = cls._pending, {}
+            cls._written.update(dict.fromkeys(pending, now))
+        cls._write(pending)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._pending.clear()
+            cls._written.clear()
+
+    @staticmethod
+    def _write(pending: dict[int, datetime.datetime]):
+        models.Contest.objects.filter(monitor_id__in=pending).update(last_ping=Case(
+            *(When(monitor_id=monitor_id, then=Value(time)) for monitor_id, time in pending.items())
+        ))
 
 
 def ping(monitor: models.Monitor):
-    for contest in monitor.contest_set.all():
-        contest.last_ping = timezone.now()
-        contest.save(update_fields=['last_ping'])
-    CodeforcesWorker()
+    PingBuffer.add(monitor.pk)
+    wake_worker()
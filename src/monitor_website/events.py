@@ -0,0 +1,124 @@
+import asyncio
+import select
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import connection, connections, transaction
+
+from .models import Monitor
+from .monitor_gen import MonitorGenerator
+
+
+class MonitorEvents:
+    """Tells the open monitor pages of this process that the worker committed new submissions.
+    On PostgreSQL the worker sends NOTIFY with the monitor pk and one thread per web process LISTENs for it,
+    so a page waits without any queries until its monitor changes. Other databases have no notifications,
+    there the stream compares the monitor version every POLL_SECONDS instead"""
+
+    CHANNEL = 'monitor_changes'
+    HEARTBEAT_SECONDS = 25
+    POLL_SECONDS = 10
+    PING_SECONDS = 5 * 60
+    # the browser reconnects by itself, so a stream whose page is gone does not live long
+    STREAM_SECONDS = 10 * 60
+    # a worker cycle commits several batches, the page reloads once after the last of them
+    COALESCE_SECONDS = 1
+    RECONNECT_SECONDS = 10
+
+    _lock = threading.Lock()
+    _subscribers: dict[int, set[(asyncio.AbstractEventLoop, asyncio.Event)]] = {}
+    _listener: threading.Thread = None
+
+    @classmethod
+    def has_notifications(cls) -> bool:
+        return connection.vendor == 'postgresql'
+
+    @classmethod
+    def notify(cls, monitor_id: int):
+        """Called by the worker inside the transaction that writes the submissions,
+        PostgreSQL delivers the notification only once it commits"""
+        if cls.has_notifications():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [cls.CHANNEL, str(monitor_id)])
+        else:
+            transaction.on_commit(lambda: cls.publish(monitor_id))
+
+    @classmethod
+    def publish(cls, monitor_id: int):
+        with cls._lock:
+            subscribers = list(cls._subscribers.get(monitor_id, ()))
+        for loop, event in subscribers:
+            loop.call_soon_threadsafe(event.set)
+
+    @classmethod
+    def _listen(cls):
+        while True:
+            listener = None
+            try:
+                listener = connections.create_connection('default')
+                listener.ensure_connection()
+                raw = listener.connection
+                raw.autocommit = True
+                with raw.cursor() as cursor:
+                    cursor.execute(f'LISTEN {cls.CHANNEL}')
+                while True:
+                    select.select([raw], [], [], cls.HEARTBEAT_SECONDS)
+                    raw.poll()
+                    while raw.notifies:
+                        cls.publish(int(raw.notifies.pop(0).payload))
+            except Exception:
+                time.sleep(cls.RECONNECT_SECONDS)
+            finally:
+                if listener is not None:
+                    listener.close()
+
+    @classmethod
+    def _subscribe(cls, monitor_id: int) -> asyncio.Event:
+        event = asyncio.Event()
+        with cls._lock:
+            cls._subscribers.setdefault(monitor_id, set()).add((asyncio.get_running_loop(), event))
+            if cls._listener is None and cls.has_notifications():
+                cls._listener = threading.Thread(target=cls._listen, name='monitor-events', daemon=True)
+                cls._listener.start()
+        return event
+
+    @classmethod
+    def _unsubscribe(cls, monitor_id: int, event: asyncio.Event):
+        with cls._lock:
+            subscribers = cls._subscribers.get(monitor_id, set())
+            subscribers.discard((asyncio.get_running_loop(), event))
+            if not subscribers:
+                cls._subscribers.pop(monitor_id, None)
+
+    @classmethod
+    async def stream(cls, monitor: Monitor, ping):
+        """Server-sent events of one page: `changed` whenever the monitor may look different,
+        comments in between so proxies keep the connection open. `ping` is called now and then,
+        so an open page keeps the worker updating the monitor as polling it did"""
+        get_version = sync_to_async(MonitorGenerator.get_version)
+        notifications = cls.has_notifications()
+        timeout = cls.HEARTBEAT_SECONDS if notifications else cls.POLL_SECONDS
+        event = cls._subscribe(monitor.pk)
+        try:
+            version = None if notifications else await get_version(monitor)
+            started = last_ping = time.monotonic()
+            yield 'retry: 10000\n\n'
+            while time.monotonic() - started < cls.STREAM_SECONDS:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout)
+                    await asyncio.sleep(cls.COALESCE_SECONDS)
+                    changed = True
+                except asyncio.TimeoutError:
+                    changed = False
+                event.clear()
+
+                if not notifications:
+                    new_version = await get_version(monitor)
+                    changed, version = new_version != version, new_version
+                if time.monotonic() - last_ping > cls.PING_SECONDS:
+                    await sync_to_async(ping)(monitor)
+                    last_ping = time.monotonic()
+                yield 'event: changed\ndata: \n\n' if changed else ': keepalive\n\n'
+        finally:
+            cls._unsubscribe(monitor.pk, event)
@@ -19,6 +19,18 @@ class NewMonitorForm(forms.ModelForm):
         fields = ('group', 'human_name', 'is_hidden')
 
 
+class ContestPollForm(forms.Form):
+    """Bounds of the interval between worker polls of one contest, empty ones are taken from the scheduler"""
+    min_seconds = forms.IntegerField(label='Не чаще, с', required=False, min_value=1)
+    max_seconds = forms.IntegerField(label='Не реже, с', required=False, min_value=1)
+
+    def clean(self):
+        data = super().clean()
+        if data.get('min_seconds') and data.get('max_seconds') and data['min_seconds'] > data['max_seconds']:
+            raise forms.ValidationError('Интервал "не чаще" больше интервала "не реже"')
+        return data
+
+
 class CreateContestForm(forms.Form):
     cf_contest = forms.IntegerField(label='ID контеста', widget=forms.TextInput(
         attrs={'class': 'form-control font-monospace',
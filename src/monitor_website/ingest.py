@@ -0,0 +1,269 @@
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .events import MonitorEvents
+from .models import Contest, Language, Monitor, Personality, StandingsCell, Submit
+
+
+class UnknownProblemError(LookupError):
+    """Submission refers to a problem the contest was not initialised with"""
+
+
+class IngestContext:
+    """Contest data the worker compares fresh submissions against, loaded once per _process_contest call"""
+
+    FIELDS = ['submission_time', 'verdict', 'test_no', 'is_contest', 'language_id', 'max_time']
+
+    def __init__(self, contest: Contest, since: timezone.datetime = None):
+        self.contest = contest
+        self.problems: dict[(str, str), int] = {
+            (index, name): pk for pk, index, name in contest.problem_set.values_list('pk', 'index', 'name')
+        }
+        self.personalities: dict[str, int] = dict(contest.monitor.personality_set.values_list('nickname', 'pk'))
+        self.languages: dict[str, int] = dict(Language.objects.values_list('name', 'pk'))
+        self.submits: dict[(int, int), tuple] = {
+            (index, personality): tuple(values)
+            for index, personality, *values in self.get_submits(contest, since)
+        }
+        self.pruned: dict[(int, int), int] = {
+            (problem, personality): until for problem, personality, until in StandingsCell.objects.filter(
+                problem__contest=contest, pruned_until__isnull=False
+            ).values_list('problem_id', 'personality_id', 'pruned_until')
+        }
+
+    @classmethod
+    def get_submits(cls, contest: Contest, since: timezone.datetime = None):
+        submits = Submit.objects.filter(contest=contest)
+        if since is not None:
+            submits = submits.filter(submission_time__gte=since)
+        return submits.values_list('index', 'personality_id', *cls.FIELDS)
+
+    def values(self, fields: dict) -> tuple:
+        """Fields of a fresh submission as they are stored. The language is given by name,
+        it becomes its id, or None while the language is new and the submission has to be written anyway"""
+        return tuple(
+            self.languages.get(fields['language']) if name == 'language_id' else fields[name] for name in self.FIELDS
+        )
+
+    def is_known(self, index: int, handle: str, fields: dict):
+        personality = self.personalities.get(handle)
+        return personality is not None and self.submits.get((index, personality)) == self.values(fields)
+
+    def is_pruned(self, index: int, handle: str, problem_key: (str, str)):
+        """Summary ingest discarded the submit, a full pass fetches it again but it is not a new one"""
+        personality = self.personalities.get(handle)
+        if personality is None or (index, personality) in self.submits:
+            return False
+        return index <= self.pruned.get((self.problems.get(problem_key), personality), -1)
+
+    def add_languages(self, names: set[str]):
+        self.languages.update(Language.get_ids(names))
+
+    def add_personalities(self, handles: set[str]):
+        monitor = self.contest.monitor
+        Personality.objects.bulk_create(
+            [Personality(monitor=monitor, nickname=handle, is_blacklisted=True) for handle in handles],
+            ignore_conflicts=True
+        )
+        self.personalities.update(
+            Personality.objects.filter(monitor=monitor, nickname__in=handles).values_list('nickname', 'pk')
+        )
+
+
+class StandingsBuilder:
+    """Recomputes StandingsCell rows of the given (problem, personality) pairs from their submits"""
+
+    CHUNK_SIZE = 1000
+    # verdicts that can still change, such submits are never discarded
+    PENDING_VERDICTS = {Submit.VERDICT_CODES['NA'], Submit.VERDICT_CODES['testing']}
+
+    @classmethod
+    def summarize(cls, problem_id: int, personality_id: int, submits: list[tuple], pruned=0) -> StandingsCell:
+        """`submits` are (pk, verdict, is_contest) tuples in the order they were sent,
+        `pruned` attempts were counted before their submits were discarded"""
+        cell = StandingsCell(problem_id=problem_id, personality_id=personality_id, updated_at=timezone.now(),
+                             attempts=pruned, pruned=pruned)
+        for pk, verdict, is_contest in submits:
+            cell.last_submit_id = pk
+            if cell.first_ok_id is not None:
+                continue
+            if verdict == Submit.OK:
+                cell.first_ok_id = pk
+                cell.is_contest = is_contest
+            else:
+                cell.attempts += 1
+        return cell
+
+    @staticmethod
+    def _get_condition(pairs: set[(int, int)]) -> Q:
+        problems: dict[int, set[int]] = {}
+        for problem, personality in pairs:
+            problems.setdefault(personality, set()).add(problem)
+        condition = Q()
+        for personality, personality_problems in problems.items():
+            condition |= Q(personality_id=personality, problem_id__in=personality_problems)
+        return condition
+
+    @classmethod
+    def get_submits(cls, pairs: set[(int, int)]):
+        """Submits of the given (problem, personality) cells in the order they were sent"""
+        return Submit.objects.filter(cls._get_condition(pairs)).order_by('submission_time', 'pk') \
+            .values_list('problem_id', 'personality_id', 'pk', 'verdict', 'is_contest')
+
+    @classmethod
+    def rebuild(cls, pairs: set[(int, int)]):
+        if not pairs:
+            return
+
+        submits: dict[(int, int), list[tuple]] = {pair: [] for pair in pairs}
+        for problem, personality, *values in cls.get_submits(pairs):
+            submits[(problem, personality)].append(values)
+        pruned: dict[(int, int), int] = {
+            (problem, personality): count for problem, personality, count in StandingsCell.objects.filter(
+                cls._get_condition(pairs), pruned__gt=0
+            ).values_list('problem_id', 'personality_id', 'pruned')
+        }
+
+        StandingsCell.objects.bulk_create(
+            [cls.summarize(*pair, rows, pruned.get(pair, 0)) for pair, rows in submits.items() if rows],
+            batch_size=cls.CHUNK_SIZE,
+            update_conflicts=True,
+            unique_fields=['personality', 'problem'],
+            update_fields=['attempts', 'first_ok', 'is_contest', 'last_submit', 'updated_at']
+        )
+
+    @classmethod
+    def _prune_chunk(cls, pairs: set[(int, int)]) -> dict[(int, int), int]:
+        cells: dict[(int, int), StandingsCell] = {
+            (cell.problem_id, cell.personality_id): cell for cell in StandingsCell.objects.select_for_update()
+            .filter(cls._get_condition(pairs)).only('problem', 'personality', 'first_ok', 'last_submit', 'pruned',
+                                                     'pruned_until')
+        }
+        solved: set[(int, int)] = set()
+        discarded: list[int] = []
+        changed: dict[(int, int), StandingsCell] = {}
+        for problem, personality, pk, index, verdict in \
+                cls.get_submits(pairs).values_list('problem_id', 'personality_id', 'pk', 'index', 'verdict'):
+            pair = (problem, personality)
+            cell = cells[pair]
+            if pk == cell.first_ok_id:
+                solved.add(pair)
+            if pk in (cell.first_ok_id, cell.last_submit_id) or verdict in cls.PENDING_VERDICTS:
+                continue
+            discarded.append(pk)
+            if pair not in solved:
+                cell.pruned += 1
+            cell.pruned_until = max(index, cell.pruned_until or 0)
+            changed[pair] = cell
+
+        for start in range(0, len(discarded), cls.CHUNK_SIZE):
+            Submit.objects.filter(pk__in=discarded[start:start + cls.CHUNK_SIZE]).delete()
+        StandingsCell.objects.bulk_update(changed.values(), ['pruned', 'pruned_until'], batch_size=cls.CHUNK_SIZE)
+        return {pair: cell.pruned_until for pair, cell in changed.items()}
+
+    @classmethod
+    def prune(cls, pairs: set[(int, int)]) -> dict[(int, int), int]:
+        """Deletes the submits of cells that the monitor does not show: attempts before the first OK
+        are only counted and resubmits after it are not used at all. The first OK, the latest submit
+        and the ones still being tested stay. The cells must be up to date and hold all of their submits,
+        returns the new pruned_until of the changed cells"""
+        pairs = list(pairs)
+        pruned = {}
+        for start in range(0, len(pairs), cls.CHUNK_SIZE):
+            with transaction.atomic():
+                pruned.update(cls._prune_chunk(set(pairs[start:start + cls.CHUNK_SIZE])))
+        return pruned
+
+    @classmethod
+    def prune_monitor(cls, monitor: Monitor):
+        """Discards the history a monitor gathered before it was switched to summary ingest"""
+        cls.prune(set(StandingsCell.objects.filter(problem__contest__monitor=monitor).values_list(
+            'problem_id', 'personality_id'
+        )))
+
+
+class SubmissionBatch:
+    """New or changed contest.status rows of one contest, written with a few bulk queries in a single transaction"""
+
+    CHUNK_SIZE = 1000
+
+    def __init__(self, context: IngestContext):
+        self.context = context
+        self._rows: dict[(int, str), ((str, str), dict)] = {}
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self._touched: set[(int, int)] = set()
+        self._written: set[(int, int)] = set()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, submission: dict, fields: dict):
+        problem_key = (f"{submission['problem']['index']}", f"{submission['problem']['name']}")
+        for participant in submission['author']['members']:
+            key = (submission['id'], participant['handle'])
+            if self.context.is_known(*key, fields) or self.context.is_pruned(*key, problem_key):
+                self.skipped += 1
+            else:
+                self._rows[key] = (problem_key, fields)
+
+    def _write_chunk(self, submits: list[Submit]):
+        Submit.objects.bulk_create(
+            submits,
+            update_conflicts=True,
+            unique_fields=['index', 'personality'],
+            update_fields=IngestContext.FIELDS
+        )
+
+        for submit in submits:
+            self._touched.add((submit.problem_id, submit.personality_id))
+            key = (submit.index, submit.personality_id)
+            if key in self.context.submits:
+                self.updated += 1
+            else:
+                self.inserted += 1
+            self.context.submits[key] = tuple(getattr(submit, name) for name in IngestContext.FIELDS)
+
+    def flush(self):
+        """Upserts collected rows and the standings cells they change. Can raise UnknownProblemError"""
+        if not self._rows:
+            return
+
+        with transaction.atomic():
+            missing = {handle for _, handle in self._rows} - self.context.personalities.keys()
+            if missing:
+                self.context.add_personalities(missing)
+            languages = {fields['language'] for _, fields in self._rows.values()} - self.context.languages.keys()
+            if languages:
+                self.context.add_languages(languages)
+
+            submits = []
+            for (index, handle), (problem_key, fields) in self._rows.items():
+                if problem_key not in self.context.problems:
+                    raise UnknownProblemError(problem_key)
+                submits.append(Submit(
+                    index=index,
+                    contest_id=self.context.contest.pk,
+                    problem_id=self.context.problems[problem_key],
+                    personality_id=self.context.personalities[handle],
+                    **dict(zip(IngestContext.FIELDS, self.context.values(fields)))
+                ))
+
+            for start in range(0, len(submits), self.CHUNK_SIZE):
+                self._write_chunk(submits[start:start + self.CHUNK_SIZE])
+
+            StandingsBuilder.rebuild(self._touched)
+            MonitorEvents.notify(self.context.contest.monitor_id)
+
+        self._written |= self._touched
+        self._rows.clear()
+        self._touched.clear()
+
+    def prune(self):
+        """Summary ingest keeps only the submits the cells show, called once the pass is flushed:
+        a full pass streams the newest submissions first, their cells are complete only at the end"""
+        if self.context.contest.monitor.ingest == Monitor.SUMMARY_INGEST:
+            self.context.pruned.update(StandingsBuilder.prune(self._written))
+        self._written.clear()
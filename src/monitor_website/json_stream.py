@@ -0,0 +1,58 @@
+import codecs
+import json
+import re
+
+
+class JsonArrayStream:
+    """Iterates over one array field of a streamed JSON object, decoding each item as soon as it is fully read,
+    so the whole document is never held in memory"""
+
+    WHITESPACE = ' \t\n\r,'
+
+    def __init__(self, chunks, key: str):
+        self._chunks = iter(chunks)
+        self._start = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+        self._decoder = json.JSONDecoder()
+        self.size = 0
+        self.found = False
+        self.document = None
+
+    def __iter__(self):
+        """Can raise ValueError on malformed or truncated documents"""
+        text = codecs.getincrementaldecoder('utf-8')()
+        buffer = ''
+        pos = None
+
+        for chunk in self._chunks:
+            self.size += len(chunk)
+            buffer += text.decode(chunk)
+
+            if pos is None:
+                match = self._start.search(buffer)
+                if match is None:
+                    continue
+                self.found = True
+                pos = match.end()
+
+            while True:
+                while pos < len(buffer) and buffer[pos] in self.WHITESPACE:
+                    pos += 1
+                if pos < len(buffer) and buffer[pos] == ']':
+                    # the rest of the object is read too, so a pooled connection can be reused
+                    for rest in self._chunks:
+                        self.size += len(rest)
+                    return
+                try:
+                    item, pos = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break
+                yield item
+
+            buffer = buffer[pos:]
+            pos = 0
+
+        buffer += text.decode(b'', final=True)
+        if pos is not None:
+            raise json.JSONDecodeError('Unterminated array', buffer, pos)
+        # the array is absent, e.g. an error reply; it is small enough to be parsed whole
+        self.document = json.loads(buffer)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from monitor_website.archive import MonitorArchiver
+from monitor_website.models import Monitor
+
+
+class Command(BaseCommand):
+    help = 'Moves submits of monitors that are not updated any more into compressed archives'
+
+    def add_arguments(self, parser):
+        parser.add_argument('monitor_ids', nargs='*', type=int, help='Only these monitors, all old ones by default')
+
+    def handle(self, *args, **options):
+        monitors = Monitor.objects.filter(is_old=True, archive__isnull=True)
+        if options['monitor_ids']:
+            monitors = monitors.filter(pk__in=options['monitor_ids'])
+
+        for monitor in monitors:
+            try:
+                archive = MonitorArchiver.archive(monitor)
+            except MonitorArchiver.ContestsLeased:
+                self.stdout.write(self.style.WARNING(f'Monitor {monitor.pk} is being updated, skipped'))
+                continue
+            if archive is not None:
+                self.stdout.write(f'Monitor {monitor.pk}: {archive.submits} submits in {len(archive.data)} bytes')
@@ -0,0 +1,146 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from monitor_website.models import Contest, Language, Monitor, Personality, Problem, Submit
+
+
+class Command(BaseCommand):
+    help = 'Compares size and standings query time of the Submit table before and after the compact schema'
+
+    LANGUAGES = ['GNU C++17', 'GNU C++20 (64)', 'Python 3', 'PyPy 3-64', 'Java 21', 'Kotlin 1.9', 'C# 10', 'Go']
+    VERDICTS = ['OK', 'WA', 'WA', 'TL', 'RE', 'CE', 'ML']
+
+    # the layout Submit had before migration 0024, with the indexes it had then
+    LEGACY_TABLE = 'bench_submit_legacy'
+    LEGACY_SCHEMA = [
+        f'CREATE TABLE {LEGACY_TABLE} (id integer PRIMARY KEY, "index" varchar(20) NOT NULL, '
+        'problem_id integer NOT NULL, personality_id integer NOT NULL, submission_time timestamp NOT NULL, '
+        'is_contest boolean NOT NULL, verdict varchar(20) NOT NULL, test_no integer NULL, '
+        'language varchar(50) NOT NULL, max_time integer NULL)',
+        f'CREATE UNIQUE INDEX {LEGACY_TABLE}_uniq ON {LEGACY_TABLE} ("index", personality_id)',
+        f'CREATE INDEX {LEGACY_TABLE}_problem ON {LEGACY_TABLE} (problem_id)',
+        f'CREATE INDEX {LEGACY_TABLE}_personality ON {LEGACY_TABLE} (personality_id)',
+        f'CREATE INDEX {LEGACY_TABLE}_time ON {LEGACY_TABLE} (problem_id, submission_time)',
+        f'CREATE INDEX {LEGACY_TABLE}_cell ON {LEGACY_TABLE} (personality_id, problem_id, submission_time)',
+    ]
+    LEGACY_CELLS = (f'SELECT problem_id, personality_id, id, verdict, is_contest FROM {LEGACY_TABLE} '
+                    'WHERE {} ORDER BY submission_time, id')
+    LEGACY_MONITOR = (f'SELECT s."index", s.verdict, s.language FROM {LEGACY_TABLE} s '
+                      'JOIN monitor_website_problem p ON p.id = s.problem_id '
+                      'JOIN monitor_website_contest c ON c.id = p.contest_id WHERE c.monitor_id = %s')
+    COMPACT_CELLS = ('SELECT problem_id, personality_id, id, verdict, is_contest FROM monitor_website_submit '
+                     'WHERE {} ORDER BY submission_time, id')
+    COMPACT_MONITOR = ('SELECT s."index", s.verdict, l.name FROM monitor_website_submit s '
+                       'LEFT JOIN monitor_website_language l ON l.id = s.language_id '
+                       'JOIN monitor_website_contest c ON c.id = s.contest_id WHERE c.monitor_id = %s')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=100000)
+        parser.add_argument('--participants', type=int, default=300)
+        parser.add_argument('--problems', type=int, default=10)
+        parser.add_argument('--cells', type=int, default=500, help='Cells recounted by one standings query')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def _generate(self, options, contest: Contest) -> list[Submit]:
+        rng = random.Random(0)
+        problems = [
+            Problem.objects.create(contest=contest, index=chr(ord('A') + i), name=f'Задача {i + 1}')
+            for i in range(options['problems'])
+        ]
+        personalities = Personality.objects.bulk_create(
+            [Personality(monitor=contest.monitor, nickname=f'bench_{i}') for i in range(options['participants'])]
+        )
+        languages = Language.get_ids(set(self.LANGUAGES))
+        start = timezone.now() - timezone.timedelta(days=30)
+        return [
+            Submit(
+                index=300000000 + i,
+                contest=contest,
+                problem_id=rng.choice(problems).pk,
+                personality_id=rng.choice(personalities).pk,
+                submission_time=start + timezone.timedelta(seconds=i * 7),
+                is_contest=rng.random() < 0.5,
+                verdict=Submit.VERDICT_CODES[rng.choice(self.VERDICTS)],
+                test_no=rng.randint(1, 50),
+                language_id=languages[rng.choice(self.LANGUAGES)],
+                max_time=rng.randint(15, 2000),
+            )
+            for i in range(options['submissions'])
+        ]
+
+    def _fill_legacy(self, submits: list[Submit]):
+        names = {pk: name for name, pk in Language.objects.values_list('name', 'pk')}
+        rows = [
+            (submit.pk, str(submit.index), submit.problem_id, submit.personality_id, submit.submission_time,
+             submit.is_contest, Submit.VERDICTS[submit.verdict], submit.test_no, names[submit.language_id],
+             submit.max_time)
+            for submit in submits
+        ]
+        with connection.cursor() as cursor:
+            for statement in self.LEGACY_SCHEMA:
+                cursor.execute(statement)
+            for start in range(0, len(rows), 5000):
+                cursor.executemany(f'INSERT INTO {self.LEGACY_TABLE} VALUES ({", ".join(["%s"] * 10)})',
+                                   rows[start:start + 5000])
+            cursor.execute(f'ANALYZE {self.LEGACY_TABLE}')
+            cursor.execute(f'ANALYZE {Submit._meta.db_table}')
+
+    def _report_sizes(self):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING(f'table sizes are only measured on PostgreSQL, not {connection.vendor}'))
+            return
+        # the Submit table also holds the submits of real monitors, so run this on an empty database
+        with connection.cursor() as cursor:
+            for name, table in [('before', self.LEGACY_TABLE), ('after', Submit._meta.db_table)]:
+                cursor.execute(
+                    'SELECT pg_relation_size(%s), pg_indexes_size(%s), pg_total_relation_size(%s)', [table] * 3
+                )
+                rows, indexes, total = cursor.fetchone()
+                self.stdout.write(f'{name}: rows {rows / 2 ** 20:.1f} MiB, indexes {indexes / 2 ** 20:.1f} MiB, '
+                                  f'total {total / 2 ** 20:.1f} MiB')
+
+    def _time(self, sql: str, params: list, repeat: int) -> (float, int):
+        best, count = None, 0
+        with connection.cursor() as cursor:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                cursor.execute(sql, params)
+                count = len(cursor.fetchall())
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+        return best, count
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            monitor = Monitor(human_name='Бенчмарк посылок')
+            monitor.save()
+            contest = Contest.objects.create(monitor=monitor, cf_contest='0')
+
+            submits = Submit.objects.bulk_create(self._generate(options, contest), batch_size=5000)
+            self._fill_legacy(submits)
+            self.stdout.write(f'{len(submits)} submits of monitor {monitor.pk}')
+            self._report_sizes()
+
+            rng = random.Random(1)
+            cells: dict[int, set[int]] = {}
+            for submit in rng.sample(submits, min(options['cells'], len(submits))):
+                cells.setdefault(submit.personality_id, set()).add(submit.problem_id)
+            condition = ' OR '.join(
+                f'(personality_id = %s AND problem_id IN ({", ".join(["%s"] * len(problems))}))'
+                for problems in cells.values()
+            )
+            params = [value for personality, problems in cells.items() for value in (personality, *problems)]
+
+            for name, legacy, compact, query_params in [
+                ('standings cells', self.LEGACY_CELLS.format(condition), self.COMPACT_CELLS.format(condition), params),
+                ('monitor submits', self.LEGACY_MONITOR, self.COMPACT_MONITOR, [monitor.pk]),
+            ]:
+                before, rows = self._time(legacy, query_params, options['repeat'])
+                after, _ = self._time(compact, query_params, options['repeat'])
+                self.stdout.write(f'{name}: {rows} rows, before {before * 1000:.1f} ms, after {after * 1000:.1f} ms')
+
+            transaction.set_rollback(True)
@@ -0,0 +1,118 @@
+import gc
+import pickle
+import random
+import tracemalloc
+from array import array
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from monitor_website.models import Contest, Language, Monitor, Personality, Problem, Submit
+from monitor_website.monitor_gen import TableCell
+
+
+class DenseTable:
+    """Persons x problems matrix of small integers, the alternative to a dict of TableCell"""
+
+    def __init__(self, persons: int, problems: int):
+        size = persons * problems
+        self.problems = problems
+        self.languages = ['']
+        self.attempts = array('H', bytes(2 * size))
+        self.index = array('q', bytes(8 * size))
+        self.verdict = array('B', bytes(size))
+        self.flags = array('B', bytes(size))
+        self.language = array('B', bytes(size))
+        self.max_time = array('I', bytes(4 * size))
+        self.test_no = array('H', bytes(2 * size))
+
+    @staticmethod
+    def _code(values: list[str], value: str) -> int:
+        if value not in values:
+            values.append(value)
+        return values.index(value)
+
+    def set(self, person: int, problem: int, attempts: int, submit: Submit):
+        i = person * self.problems + problem
+        self.attempts[i] = attempts
+        self.index[i] = submit.index
+        self.verdict[i] = submit.verdict
+        self.flags[i] = 1 | (2 if submit.is_contest else 0)
+        self.language[i] = self._code(self.languages, submit.language.name)
+        self.max_time[i] = submit.max_time
+        self.test_no[i] = submit.test_no or 0
+
+
+class Command(BaseCommand):
+    help = 'Compares memory of the standings table kept as Submit lists, as TableCell dict and as a dense matrix'
+
+    VERDICTS = [Submit.VERDICT_CODES[name] for name in ['OK', 'WA', 'TL', 'RE', 'CE']]
+    LANGUAGES = [Language(pk=i + 1, name=name) for i, name in enumerate(['GNU C++17', 'Python 3', 'PyPy 3'])]
+
+    def add_arguments(self, parser):
+        parser.add_argument('--participants', type=int, default=1000)
+        parser.add_argument('--problems', type=int, default=100)
+        parser.add_argument('--submits-per-cell', type=int, default=3)
+        parser.add_argument('--fill', type=float, default=0.6, help='Share of cells with submits')
+
+    def _generate(self, options):
+        """Unsaved instances, the benchmark does not touch the database"""
+        rng = random.Random(0)
+        monitor = Monitor(pk=1, group='benchmark')
+        contest = Contest(pk=1, monitor=monitor, cf_contest='1')
+        persons = [Personality(pk=i + 1, monitor=monitor, nickname=f'user{i}') for i in range(options['participants'])]
+        problems = [Problem(pk=i + 1, contest=contest, index=f'{i}') for i in range(options['problems'])]
+        time = timezone.now()
+
+        cells = {}
+        next_index = 1
+        for person in persons:
+            for problem in problems:
+                if rng.random() >= options['fill']:
+                    continue
+                submits = []
+                for _ in range(options['submits_per_cell']):
+                    submits.append(Submit(
+                        index=next_index, contest=contest, problem=problem, personality=person, submission_time=time,
+                        is_contest=rng.random() < 0.5, verdict=rng.choice(self.VERDICTS),
+                        test_no=rng.randrange(1, 50), language=rng.choice(self.LANGUAGES), max_time=rng.randrange(2000)
+                    ))
+                    next_index += 1
+                cells[(person, problem)] = submits
+        return persons, problems, cells
+
+    @staticmethod
+    def _shown(submits: list[Submit]) -> (int, Submit):
+        for attempts, submit in enumerate(submits):
+            if submit.verdict == Submit.OK:
+                return attempts, submit
+        return len(submits), submits[-1]
+
+    def _measure(self, name, build):
+        gc.collect()
+        tracemalloc.start()
+        table = build()
+        gc.collect()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        pickled = len(pickle.dumps(table, pickle.HIGHEST_PROTOCOL))
+        self.stdout.write(f'{name:<12} {size / 2 ** 20:10.1f} MB in memory {pickled / 2 ** 20:10.1f} MB pickled')
+        return table
+
+    def handle(self, *args, **options):
+        persons, problems, cells = self._generate(options)
+        self.stdout.write(f'{len(persons)} participants, {len(problems)} problems, {len(cells)} cells with submits')
+
+        self._measure('submits', lambda: self._generate(options)[2])
+        self._measure('table cells', lambda: {
+            (person.pk, problem.pk): TableCell(attempts, submit.index, Submit.VERDICTS[submit.verdict], submit.is_contest,
+                                               submit.language.name, submit.max_time, submit.test_no)
+            for (person, problem), (attempts, submit) in ((key, self._shown(s)) for key, s in cells.items())
+        })
+
+        def build_dense():
+            table = DenseTable(len(persons), len(problems))
+            for (person, problem), submits in cells.items():
+                table.set(person.pk - 1, problem.pk - 1, *self._shown(submits))
+            return table
+        self._measure('dense matrix', build_dense)
@@ -0,0 +1,100 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from monitor_website import models
+from monitor_website.cf_fake import FakeCodeforcesAdapter, FakeContest
+from monitor_website.cf_worker import CodeforcesAPIManager, CodeforcesWorker, TokenBucket
+
+
+class Command(BaseCommand):
+    help = 'Measures the worker ingest path against a local Codeforces stand-in, without network access'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fixture', help='Contest recorded with `manage.py record_cf_fixture`')
+        parser.add_argument('--submissions', type=int, default=20000, help='Size of a generated contest')
+        parser.add_argument('--participants', type=int, default=300)
+        parser.add_argument('--problems', type=int, default=10)
+        parser.add_argument('--cycles', type=int, default=10, help='Incremental passes after the full one')
+        parser.add_argument('--new-per-cycle', type=int, default=50, help='Submissions added before every pass')
+        parser.add_argument('--latency', type=float, default=0., help='Seconds added to every API call')
+        parser.add_argument('--rate-limit-rate', type=float, default=0., help='Share of "Call limit exceeded" replies')
+        parser.add_argument('--error-rate', type=float, default=0., help='Share of unavailable service pages')
+        parser.add_argument('--connection-error-rate', type=float, default=0., help='Share of dropped connections')
+        parser.add_argument('--summary', action='store_true', help='Ingest into a summary monitor')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark monitor in the database')
+
+    def _run_pass(self, worker: CodeforcesWorker, contest: models.Contest, stats, full_update=False):
+        fetch = worker._plan_fetch(contest, full_update)
+        fetch.stats = stats
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            try:
+                worker._fetch(fetch)
+                fetched = time.perf_counter()
+                worker._process_contest(fetch)
+            except requests.exceptions.RequestException as e:
+                self.stdout.write(self.style.WARNING(f'  pass failed: {e}'))
+                return None
+            finished = time.perf_counter()
+        contest.refresh_from_db()
+        if contest.error_text is not None:
+            self.stdout.write(self.style.WARNING(f'  pass failed: {contest.error_text}'))
+            contest.error_text = None
+            contest.save(update_fields=['error_text'])
+            return None
+        return fetched - started, finished - fetched, len(queries), fetch.changed
+
+    def _report(self, name, result, submissions):
+        if result is None:
+            return
+        fetch_seconds, process_seconds, queries, changed = result
+        total = fetch_seconds + process_seconds
+        self.stdout.write(
+            f'{name}: {submissions} submissions, {changed} written, fetch {fetch_seconds:.3f}s, '
+            f'ingest {process_seconds:.3f}s, {queries} queries, {submissions / max(total, 1e-9):.0f} submissions/s'
+        )
+
+    def handle(self, *args, **options):
+        if options['fixture']:
+            fake = FakeContest.load(options['fixture'])
+        else:
+            fake = FakeContest.generate(options['submissions'], options['participants'], options['problems'])
+        adapter = FakeCodeforcesAdapter(
+            fake,
+            latency=options['latency'],
+            rate_limit_rate=options['rate_limit_rate'],
+            error_rate=options['error_rate'],
+            connection_error_rate=options['connection_error_rate'],
+        )
+        CodeforcesAPIManager.session.mount('https://codeforces.com/', adapter)
+        # the stand-in has no call limit, the bucket would only measure its own sleeping
+        CodeforcesAPIManager.bucket = TokenBucket(1e9, 1e9)
+
+        with transaction.atomic():
+            monitor = models.Monitor(
+                human_name='Бенчмарк воркера',
+                ingest=models.Monitor.SUMMARY_INGEST if options['summary'] else models.Monitor.FULL_INGEST
+            )
+            monitor.save()
+            contest = models.Contest.objects.create(monitor=monitor, cf_contest=str(fake.contest_id))
+            worker = CodeforcesWorker(embedded=False)
+            stats = CodeforcesAPIManager.CallStats()
+
+            self._report('full', self._run_pass(worker, contest, stats, True), len(fake.status))
+            for cycle in range(options['cycles']):
+                fake.add_submissions(options['new_per_cycle'], testing=options['new_per_cycle'] // 5)
+                if cycle % 2:
+                    fake.judge()
+                self._report(f'cycle {cycle + 1}', self._run_pass(worker, contest, stats), options['new_per_cycle'])
+            self._report('unchanged', self._run_pass(worker, contest, stats), 0)
+
+            self.stdout.write(f'API calls: {adapter.calls}, wire bytes: {stats.wire_bytes}, body bytes: {stats.body_bytes}')
+            self.stdout.write(f'stored submits: {models.Submit.objects.filter(contest=contest).count()}, '
+                              f'standings cells: {models.StandingsCell.objects.filter(problem__contest=contest).count()}')
+
+            if not options['keep']:
+                transaction.set_rollback(True)
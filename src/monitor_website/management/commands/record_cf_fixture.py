@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from monitor_website.cf_fake import FakeContest
+from monitor_website.cf_worker import CodeforcesAPIManager
+
+
+class Command(BaseCommand):
+    help = 'Saves standings and all submissions of a Codeforces contest for `manage.py bench_worker --fixture`'
+
+    def add_arguments(self, parser):
+        parser.add_argument('contest_id')
+        parser.add_argument('path')
+
+    def _get_result(self, contest_id, query_name):
+        reply = CodeforcesAPIManager.get_cf_query(contest_id, query_name)
+        if reply.get('status') != 'OK':
+            raise CommandError(f'{query_name}: {reply.get("comment", "Unknown problem")}')
+        return reply['result']
+
+    def handle(self, *args, **options):
+        contest_id = options['contest_id']
+        standings = self._get_result(contest_id, 'contest.standings')
+        status = self._get_result(contest_id, 'contest.status')
+        FakeContest(contest_id, {'contest': standings['contest'], 'problems': standings['problems']}, status) \
+            .dump(options['path'])
+        self.stdout.write(f'Saved {len(status)} submissions of contest {contest_id} to {options["path"]}')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from monitor_website.archive import MonitorArchiver
+from monitor_website.models import Monitor
+
+
+class Command(BaseCommand):
+    help = 'Puts the archived submits of a monitor back into the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('monitor_id', type=int)
+        parser.add_argument('--resume', action='store_true', help='Also let the worker update the monitor again')
+
+    def handle(self, *args, **options):
+        monitor = Monitor.objects.filter(pk=options['monitor_id']).first()
+        if monitor is None:
+            raise CommandError(f'Monitor {options["monitor_id"]} does not exist')
+
+        if options['resume']:
+            monitor.is_old = False
+            monitor.save(update_fields=['is_old'])
+        self.stdout.write(f'Monitor {monitor.pk}: {MonitorArchiver.rehydrate(monitor)} submits restored')
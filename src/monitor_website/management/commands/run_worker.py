@@ -0,0 +1,49 @@
+import multiprocessing
+import signal
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from monitor_website.cf_worker import CodeforcesAPIManager, CodeforcesWorker, TokenBucket
+
+
+def _run_worker():
+    # SystemExit unwinds the worker loop, which releases the leased contests
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    CodeforcesWorker(embedded=False).start()
+
+
+class Command(BaseCommand):
+    help = 'Runs the Codeforces worker outside of the web processes'
+
+    CHECK_SECONDS = 10
+    STOP_SECONDS = 10
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Number of worker processes')
+
+    def handle(self, *args, **options):
+        # all processes share one rate limit, since Codeforces counts calls per API key
+        CodeforcesAPIManager.bucket = TokenBucket(CodeforcesAPIManager.RATE, CodeforcesAPIManager.BURST, shared=True)
+        # forked processes must open their own database connections
+        connections.close_all()
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+        context = multiprocessing.get_context('fork')
+        processes = []
+        try:
+            while True:
+                processes = [process for process in processes if process.is_alive()]
+                for _ in range(options['processes'] - len(processes)):
+                    process = context.Process(target=_run_worker, daemon=True)
+                    process.start()
+                    processes.append(process)
+                    self.stdout.write(f'Started worker process {process.pid}')
+                time.sleep(self.CHECK_SECONDS)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join(self.STOP_SECONDS)
@@ -0,0 +1,28 @@
+# Generated by Django 4.0.5 on 2026-10-18 17:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0013_remove_contest_last_big_update'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contest',
+            name='last_full_update',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='last_submission_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='last_submission_time',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-18 17:28
+
+from django.db import migrations
+from django.db.models import Max, Count
+
+
+def remove_duplicate_submits(apps, schema_editor):
+    Submit = apps.get_model('monitor_website', 'Submit')
+    duplicates = Submit.objects.values('index', 'personality').annotate(last=Max('pk'), n=Count('pk')).filter(n__gt=1)
+    for duplicate in duplicates:
+        Submit.objects.filter(
+            index=duplicate['index'],
+            personality=duplicate['personality'],
+            pk__lt=duplicate['last']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0014_contest_last_full_update_contest_last_submission_id_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_submits, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='submit',
+            unique_together={('index', 'personality')},
+        ),
+    ]
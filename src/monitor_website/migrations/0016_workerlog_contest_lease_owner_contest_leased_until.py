@@ -0,0 +1,37 @@
+# Generated by Django 4.2.16 on 2026-10-18 17:33
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0015_alter_submit_unique_together'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkerLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time', models.DateTimeField(default=django.utils.timezone.now)),
+                ('worker', models.CharField(blank=True, max_length=100)),
+                ('comment', models.TextField()),
+                ('style', models.CharField(blank=True, max_length=20)),
+            ],
+            options={
+                'ordering': ['-pk'],
+            },
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='lease_owner',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='leased_until',
+            field=models.DateTimeField(null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0016_workerlog_contest_lease_owner_contest_leased_until'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contest',
+            name='fail_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='max_poll_interval',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='min_poll_interval',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='submission_rate',
+            field=models.FloatField(default=0),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-18 17:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0017_contest_fail_count_contest_max_poll_interval_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contest',
+            name='processed_cycles',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='skipped_cycles',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='status_fingerprint',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.16 on 2026-10-18 17:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def build_standings(apps, schema_editor):
+    Submit = apps.get_model('monitor_website', 'Submit')
+    StandingsCell = apps.get_model('monitor_website', 'StandingsCell')
+    now = django.utils.timezone.now()
+
+    cells = {}
+    query = Submit.objects.order_by('submission_time', 'pk') \
+        .values_list('problem_id', 'personality_id', 'pk', 'verdict', 'is_contest')
+    for problem, personality, pk, verdict, is_contest in query.iterator(chunk_size=2000):
+        cell = cells.get((problem, personality))
+        if cell is None:
+            cell = cells[(problem, personality)] = StandingsCell(
+                problem_id=problem, personality_id=personality, updated_at=now
+            )
+        cell.last_submit_id = pk
+        if cell.first_ok_id is None:
+            if verdict == 'OK':
+                cell.first_ok_id = pk
+                cell.is_contest = is_contest
+            else:
+                cell.attempts += 1
+    StandingsCell.objects.bulk_create(cells.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0018_contest_processed_cycles_contest_skipped_cycles_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StandingsCell',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.IntegerField(default=0)),
+                ('is_contest', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('first_ok', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='monitor_website.submit')),
+                ('last_submit', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='monitor_website.submit')),
+                ('personality', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitor_website.personality')),
+                ('problem', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitor_website.problem')),
+            ],
+            options={
+                'unique_together': {('personality', 'problem')},
+            },
+        ),
+        migrations.RunPython(build_standings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.16 on 2026-10-18 17:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0019_standingscell'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contest',
+            index=models.Index(condition=models.Q(('error_text__isnull', True)), fields=['last_ping'], name='contest_active_ping_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='standingscell',
+            index=models.Index(fields=['problem', 'updated_at'], name='standings_problem_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submit',
+            index=models.Index(fields=['problem', 'submission_time'], name='submit_problem_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='submit',
+            index=models.Index(fields=['personality', 'problem', 'submission_time'], name='submit_person_problem_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 17:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0020_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonitorArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('submits', models.IntegerField(default=0, verbose_name='Посылок в архиве')),
+                ('data', models.BinaryField()),
+                ('monitor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='monitor_website.monitor')),
+            ],
+        ),
+    ]
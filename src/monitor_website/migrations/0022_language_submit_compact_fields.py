@@ -0,0 +1,36 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0021_monitorarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Language',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='submit',
+            name='contest',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='monitor_website.contest'),
+        ),
+        migrations.AddField(
+            model_name='submit',
+            name='verdict_code',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='submit',
+            name='language_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='monitor_website.language'),
+        ),
+    ]
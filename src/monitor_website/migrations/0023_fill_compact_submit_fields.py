@@ -0,0 +1,46 @@
+import json
+import zlib
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+# Submit.VERDICTS at the time of this migration
+VERDICTS = ['NA', 'OK', 'FAIL', 'CE', 'RE', 'WA', 'PE', 'TL', 'ML', 'IdL', 'SV', 'crash', 'skip', 'testing', 'reject']
+
+
+def fill_compact_fields(apps, schema_editor):
+    Submit = apps.get_model('monitor_website', 'Submit')
+    Problem = apps.get_model('monitor_website', 'Problem')
+    Language = apps.get_model('monitor_website', 'Language')
+    MonitorArchive = apps.get_model('monitor_website', 'MonitorArchive')
+
+    Submit.objects.update(contest_id=Subquery(Problem.objects.filter(pk=OuterRef('problem_id')).values('contest_id')))
+    for code, name in enumerate(VERDICTS):
+        if code:
+            Submit.objects.filter(verdict=name).update(verdict_code=code)
+
+    names = set(Submit.objects.exclude(language='').values_list('language', flat=True).distinct())
+    Language.objects.bulk_create([Language(name=name) for name in names], ignore_conflicts=True)
+    for pk, name in Language.objects.filter(name__in=names).values_list('pk', 'name'):
+        Submit.objects.filter(language=name).update(language_ref_id=pk)
+
+    # archived submits keep their language names, their verdicts and indexes change as in the table
+    codes = {name: code for code, name in enumerate(VERDICTS)}
+    for archive in MonitorArchive.objects.all():
+        payload = json.loads(zlib.decompress(archive.data))
+        for submit in payload['submits']:
+            submit[0] = int(submit[0])
+            submit[5] = codes.get(submit[5], 0)
+        archive.data = zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), 9)
+        archive.save(update_fields=['data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0022_language_submit_compact_fields'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_compact_fields, migrations.RunPython.noop),
+    ]
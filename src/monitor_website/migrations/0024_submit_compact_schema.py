@@ -0,0 +1,55 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0023_fill_compact_submit_fields'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='submit',
+            name='submit_problem_time_idx',
+        ),
+        migrations.RemoveField(
+            model_name='submit',
+            name='verdict',
+        ),
+        migrations.RenameField(
+            model_name='submit',
+            old_name='verdict_code',
+            new_name='verdict',
+        ),
+        migrations.RemoveField(
+            model_name='submit',
+            name='language',
+        ),
+        migrations.RenameField(
+            model_name='submit',
+            old_name='language_ref',
+            new_name='language',
+        ),
+        migrations.AlterField(
+            model_name='submit',
+            name='verdict',
+            field=models.PositiveSmallIntegerField(choices=[(0, 'NA'), (1, 'OK'), (2, 'FAIL'), (3, 'CE'), (4, 'RE'), (5, 'WA'), (6, 'PE'), (7, 'TL'), (8, 'ML'), (9, 'IdL'), (10, 'SV'), (11, 'crash'), (12, 'skip'), (13, 'testing'), (14, 'reject')]),
+        ),
+        migrations.AlterField(
+            model_name='submit',
+            name='contest',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitor_website.contest'),
+        ),
+        migrations.AlterField(
+            model_name='submit',
+            name='index',
+            field=models.BigIntegerField(verbose_name='Номер посылки'),
+        ),
+        migrations.AddIndex(
+            model_name='submit',
+            index=models.Index(fields=['contest', 'submission_time'], name='submit_contest_time_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0024_submit_compact_schema'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monitor',
+            name='ingest',
+            field=models.CharField(choices=[('full', 'Все посылки'), ('summary', 'Только решающие посылки')], default='full', max_length=10, verbose_name='Хранение посылок'),
+        ),
+        migrations.AddField(
+            model_name='standingscell',
+            name='pruned',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='standingscell',
+            name='pruned_until',
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0025_summary_ingest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contest',
+            name='api_body_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='api_calls',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='api_seconds',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='contest',
+            name='api_wire_bytes',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
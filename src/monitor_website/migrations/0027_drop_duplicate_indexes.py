@@ -0,0 +1,30 @@
+# Generated by Django 4.2.16 on 2026-10-18 18:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor_website', '0026_contest_api_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='standingscell',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AlterField(
+            model_name='submit',
+            name='contest',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='monitor_website.contest'),
+        ),
+        migrations.AlterField(
+            model_name='submit',
+            name='personality',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='monitor_website.personality'),
+        ),
+    ]
@@ -1,3 +1,6 @@
+import json
+import zlib
+
 import django.utils.timezone as tz
 from django.db import models
 from django.urls import reverse
@@ -12,6 +15,13 @@ class Monitor(models.Model):
     is_old = models.BooleanField(default=False)
     is_hidden = models.BooleanField(default=True)
     index = models.IntegerField(null=True)
+
+    FULL_INGEST = 'full'
+    SUMMARY_INGEST = 'summary'
+    ingest = models.CharField("Хранение посылок", max_length=10, default=FULL_INGEST, choices=[
+        (FULL_INGEST, 'Все посылки'),
+        (SUMMARY_INGEST, 'Только решающие посылки'),
+    ])
     # todo
     # owner = models.ForeignKey(User, to_field='username', on_delete=models.CASCADE)
     # editors = models.ManyToManyField(User)
@@ -23,9 +33,9 @@ class Monitor(models.Model):
     def get_absolute_url(self):
         return reverse('main:monitor', kwargs={"monitor_id": self.pk})
 
-    def last_update(self):
+    def last_update(self, contests=None):
         mn = None
-        for contest in self.contest_set.all():
+        for contest in self.contest_set.all() if contests is None else contests:
             if contest.last_status_update is None:
                 return None
             if mn is None:
@@ -80,21 +90,47 @@ class Problem(models.Model):
         return f"https://codeforces.com/group/{self.contest.monitor.group}/contest/{self.contest.cf_contest}/problem/{self.index}"
 
 
+class Language(models.Model):
+    """Programming language of submits, stored once instead of in every Submit row"""
+    name = models.CharField(max_length=50, unique=True)
+
+    @classmethod
+    def get_ids(cls, names: set[str]) -> dict[str, int]:
+        """Ids of the languages, adding the ones seen for the first time"""
+        cls.objects.bulk_create([cls(name=name) for name in names], ignore_conflicts=True)
+        return dict(cls.objects.filter(name__in=names).values_list('name', 'pk'))
+
+
 class Submit(models.Model):
-    index = models.CharField("Индекс", max_length=20)
+    # short names of verdicts, stored as their positions, so new ones are only ever appended
+    VERDICTS = ['NA', 'OK', 'FAIL', 'CE', 'RE', 'WA', 'PE', 'TL', 'ML', 'IdL', 'SV', 'crash', 'skip', 'testing', 'reject']
+    VERDICT_CODES = {name: code for code, name in enumerate(VERDICTS)}
+    OK = VERDICT_CODES['OK']
+
+    index = models.BigIntegerField("Номер посылки")
+    # the same as problem.contest, so a contest's submits are found without joining problems
+    # contest and personality lead the indexes below, which also serve their foreign keys
+    contest = models.ForeignKey("Contest", on_delete=models.CASCADE, db_index=False)
     problem = models.ForeignKey(Problem, on_delete=models.CASCADE)
-    personality = models.ForeignKey(Personality, on_delete=models.CASCADE)
+    personality = models.ForeignKey(Personality, on_delete=models.CASCADE, db_index=False)
     submission_time = models.DateTimeField("Дата отправления")
     is_contest = models.BooleanField("Сдано на контесте?")
-    verdict = models.CharField(max_length=20)
+    verdict = models.PositiveSmallIntegerField(choices=list(enumerate(VERDICTS)))
     test_no = models.IntegerField(null=True)
-    language = models.CharField(max_length=50, blank=True)
+    language = models.ForeignKey(Language, on_delete=models.PROTECT, null=True)
     max_time = models.IntegerField(null=True)
 
-    OK = "OK"
+    class Meta:
+        unique_together = ['index', 'personality']
+        indexes = [
+            # submits of a contest since the watermark, read by IngestContext
+            models.Index(fields=['contest', 'submission_time'], name='submit_contest_time_idx'),
+            # submits of the cells StandingsBuilder.rebuild recounts, in their order
+            models.Index(fields=['personality', 'problem', 'submission_time'], name='submit_person_problem_idx'),
+        ]
 
     def get_cf_url(self):
-        return f"https://codeforces.com/group/{self.problem.contest.monitor.group}/contest/{self.problem.contest.cf_contest}/submission/{self.index}"
+        return self.contest.get_submission_cf_url(self.index)
 
 
 class Contest(models.Model):
@@ -107,8 +143,34 @@ class Contest(models.Model):
     last_status_update = models.DateTimeField(null=True)
     last_ping = models.DateTimeField(null=True)
 
+    last_submission_id = models.BigIntegerField(null=True)
+    last_submission_time = models.DateTimeField(null=True)
+    last_full_update = models.DateTimeField(null=True)
+
+    lease_owner = models.CharField(max_length=100, blank=True)
+    leased_until = models.DateTimeField(null=True)
+
+    submission_rate = models.FloatField(default=0)
+    fail_count = models.IntegerField(default=0)
+    min_poll_interval = models.DurationField(null=True, blank=True)
+    max_poll_interval = models.DurationField(null=True, blank=True)
+
+    status_fingerprint = models.CharField(max_length=100, blank=True)
+    processed_cycles = models.IntegerField(default=0)
+    skipped_cycles = models.IntegerField(default=0)
+
+    # Codeforces API calls made by the workers for this contest
+    api_calls = models.IntegerField(default=0)
+    api_seconds = models.FloatField(default=0)
+    api_wire_bytes = models.BigIntegerField(default=0)
+    api_body_bytes = models.BigIntegerField(default=0)
+
     class Meta:
         ordering = ['index']
+        indexes = [
+            # contests the worker may claim: recently viewed and without errors
+            models.Index(fields=['last_ping'], condition=models.Q(error_text__isnull=True), name='contest_active_ping_idx'),
+        ]
 
     def get_name(self):
         if self.human_name:
@@ -118,6 +180,15 @@ class Contest(models.Model):
     def get_cf_url(self):
         return f"https://codeforces.com/group/{self.monitor.group}/contest/{self.cf_contest}"
 
+    def get_submission_cf_url(self, index):
+        return f"{self.get_cf_url()}/submission/{index}"
+
+    def is_leased(self):
+        return self.leased_until is not None and self.leased_until > tz.now()
+
+    def api_avg_seconds(self):
+        return self.api_seconds / self.api_calls if self.api_calls else 0.
+
     def set_error(self, comment):
         self.error_text = comment
         self.save(update_fields=['error_text'])
@@ -125,8 +196,56 @@ class Contest(models.Model):
     def refresh(self):
         self.problem_set.all().delete()
         self.last_status_update = None
+        self.last_submission_id = None
+        self.last_submission_time = None
+        self.last_full_update = None
+        self.status_fingerprint = ''
         self.error_text = None
-        self.save(update_fields=['last_status_update', 'error_text'])
+        self.save(update_fields=[
+            'last_status_update', 'last_submission_id', 'last_submission_time', 'last_full_update',
+            'status_fingerprint', 'error_text'
+        ])
+
+
+class StandingsCell(models.Model):
+    """Summary of one participant's submits on one problem, kept up to date by the worker"""
+    personality = models.ForeignKey(Personality, on_delete=models.CASCADE)
+    problem = models.ForeignKey(Problem, on_delete=models.CASCADE)
+    attempts = models.IntegerField(default=0)  # submits before the first OK, or all of them if there is none
+    first_ok = models.ForeignKey(Submit, on_delete=models.SET_NULL, null=True, related_name='+')
+    is_contest = models.BooleanField(default=False)
+    last_submit = models.ForeignKey(Submit, on_delete=models.SET_NULL, null=True, related_name='+')
+    updated_at = models.DateTimeField(default=tz.now)
+    # attempts whose submits were discarded by summary ingest, and the newest index among them,
+    # so these submits are not taken for new ones when the worker fetches them again
+    pruned = models.IntegerField(default=0)
+    pruned_until = models.BigIntegerField(null=True)
+
+    class Meta:
+        unique_together = ['personality', 'problem']
+        indexes = [
+            # cells of a monitor changed since the last read of MonitorGenerator
+            models.Index(fields=['problem', 'updated_at'], name='standings_problem_updated_idx'),
+        ]
+
+    def get_result(self) -> (int, Submit or None):
+        """Number of attempts and the submit the monitor shows: the first OK one or else the last one"""
+        return self.attempts, self.first_ok if self.first_ok_id is not None else self.last_submit
+
+
+class MonitorArchive(models.Model):
+    """Standings and submits of an old monitor, moved out of the Submit and StandingsCell tables
+    as zlib-compressed JSON. Written and read back by monitor_website.archive"""
+    monitor = models.OneToOneField(Monitor, on_delete=models.CASCADE, related_name='archive')
+    created_at = models.DateTimeField(default=tz.now)
+    submits = models.IntegerField("Посылок в архиве", default=0)
+    data = models.BinaryField()
+
+    def pack(self, payload: dict):
+        self.data = zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), 9)
+
+    def unpack(self) -> dict:
+        return json.loads(zlib.decompress(self.data))
 
 
 @receiver(post_save, sender=Contest)
@@ -134,3 +253,13 @@ def contest_post_save(sender, instance, created, raw, using, update_fields, **kw
     if created:
         instance.index = instance.pk
         instance.save(update_fields=['index'])
+
+
+class WorkerLog(models.Model):
+    time = models.DateTimeField(default=tz.now)
+    worker = models.CharField(max_length=100, blank=True)
+    comment = models.TextField()
+    style = models.CharField(max_length=20, blank=True)
+
+    class Meta:
+        ordering = ['-pk']
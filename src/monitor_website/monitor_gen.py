@@ -1,101 +1,263 @@
-from collections import defaultdict
+import sys
+from bisect import bisect_right
+from hashlib import sha1
 
-from .models import Monitor, Personality, Problem, Submit
+from .models import Monitor, MonitorArchive, Personality, Problem, StandingsCell, Submit
+from django.core.cache import caches
+from django.db.models import OuterRef, Subquery
 from django.utils import timezone
 
 
 class TableCell:
-    def __init__(self):
-        self._submits: list[Submit] = []
-        self.first_success = 0
-
-    def _clean_up(self):
-        self._submits.sort()
-        self.first_success = 0
-        while self.first_success < len(self._submits) and self._submits[self.first_success].verdict != Submit.OK:
-            self.first_success += 1
-
-    def add_submit(self, submit: Submit):
-        self._submits.append(submit)
-        if len(self._submits) > 1 and self._submits[-2].submission_time > submit.submission_time:
-            self._clean_up()
-        elif self.first_success == len(self._submits) - 1 and submit.verdict != Submit.OK:
-            self.first_success += 1
-
-    def remove_until(self, datetime: timezone.datetime):
-        while self._submits and self._submits[-1].submission_time > datetime:
-            self._submits.pop()
-        self.first_success = min(self.first_success, len(self._submits))
-
-    def get_result(self) -> (int or None, Submit or None):
-        if len(self._submits) == 0:
-            return None, None
-        elif self.first_success >= len(self._submits):
-            return self.first_success, self._submits[-1]
-        else:
-            return self.first_success, self._submits[self.first_success]
+    """What _monitor.html shows for one participant and problem: the number of attempts
+    and the few fields of the shown submit, which is the first OK one or else the last one"""
+
+    __slots__ = ('attempts', 'index', 'verdict', 'is_contest', 'language', 'max_time', 'test_no')
+    # columns of the shown Submit, in the order of the arguments
+    FIELDS = ('index', 'verdict', 'is_contest', 'language__name', 'max_time', 'test_no')
+    OK = Submit.VERDICTS[Submit.OK]
+
+    def __init__(self, attempts: int, index: int, verdict: str, is_contest: bool, language: str, max_time: int,
+                 test_no: int or None):
+        self.attempts = attempts
+        self.index = index
+        # verdicts and languages repeat over the table, so every cell refers to one shared string
+        self.verdict = sys.intern(verdict)
+        self.is_contest = is_contest
+        self.language = sys.intern(language or '')
+        self.max_time = max_time
+        self.test_no = test_no
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def __eq__(self, other):
+        return isinstance(other, TableCell) and self.__getstate__() == other.__getstate__()
+
+    def get_result(self) -> (int, 'TableCell'):
+        return self.attempts, self
+
+
+class StandingsSnapshot:
+    """Places and cells of one monitor version, so a polling client can be sent only what changed since"""
+
+    # memory a result tuple and its link take, measured on a 2000 x 50 table
+    RESULT_BYTES = 120
+
+    def __init__(self, rows: list[list], problem_list: list[Problem]):
+        self.columns = [problem.pk for problem in problem_list]
+        self.order = [person.pk for _, _, person, *_ in rows]
+        self.names = {person.pk: person.get_name() for _, _, person, *_ in rows}
+        self.ranks = {person.pk: (index, delta, solved, practiced)
+                      for index, delta, person, _, solved, practiced in rows}
+        self.results = {person.pk: results for _, _, person, results, *_ in rows}
+
+    def diff(self, new: 'StandingsSnapshot') -> (list[tuple], list[tuple]) or None:
+        """Changed (personality, column, result) cells and (personality, ranks) rows,
+        None when the tables have different participants or problems"""
+        if self.columns != new.columns or self.names != new.names:
+            return None
+        cells = [
+            (pk, column, result)
+            for pk, results in new.results.items()
+            for column, (old, result) in enumerate(zip(self.results[pk], results)) if old != result
+        ]
+        ranks = [(pk, rank) for pk, rank in new.ranks.items() if self.ranks[pk] != rank]
+        return cells, ranks
+
+    def get_cache_size(self) -> int:
+        return self.RESULT_BYTES * len(self.order) * len(self.columns)
 
 
 class MonitorGenerator:
 
-    _raw_tables: dict[Monitor, dict[(Personality, Problem), TableCell]] = defaultdict(lambda: defaultdict(TableCell))
-    _last_updates: dict[Monitor, timezone.datetime] = defaultdict(lambda: MonitorGenerator.DEFAULT_DATETIME)
+    class State:
+        """Standings cells of one monitor and the time they were read, kept in the `monitor_tables` cache,
+        so every web process continues from the same warm table.
+        The local backend keeps the object itself, which requests update in place and set back"""
+
+        # archived tables never change, until the monitor is rehydrated and the state dropped
+        archived = False
+        # memory a TableCell and its table entry take, measured on 10^5 cells
+        CELL_BYTES = 300
+
+        def __init__(self):
+            self.table: dict[(int, int), TableCell] = {}
+            self.last_update = MonitorGenerator.DEFAULT_DATETIME
+
+        def get_cache_size(self) -> int:
+            return self.CELL_BYTES * len(self.table)
+
+    CACHE = 'monitor_tables'
     DEFAULT_DELTA = timezone.timedelta(minutes=30)
     DEFAULT_DATETIME = timezone.make_aware(timezone.datetime.min + DEFAULT_DELTA)
+    CHUNK_SIZE = 2000
+
+    @staticmethod
+    def _get_key(monitor: Monitor):
+        return f'monitor_table:{monitor.pk}'
+
+    @classmethod
+    def get_changed_cells(cls, monitor: Monitor, from_time: timezone.datetime):
+        """Standings cells the worker changed since `from_time`, all of them for the default time"""
+        query = StandingsCell.objects.filter(problem__contest__monitor=monitor).values_list(
+            'personality_id', 'problem_id', 'attempts', 'first_ok_id',
+            *(f'{submit}__{field}' for submit in ('first_ok', 'last_submit') for field in TableCell.FIELDS)
+        )
+        if from_time > cls.DEFAULT_DATETIME - cls.DEFAULT_DELTA:
+            query = query.filter(updated_at__gt=from_time)
+        return query
 
     @classmethod
     def __update_table(cls,
-                       table: dict[(Personality, Problem), TableCell],
-                       personalities: list[Personality],
-                       problem_list: list[Problem],
+                       monitor: Monitor,
+                       table: dict[(int, int), TableCell],
                        from_time: timezone.datetime
-                       ):
+                       ) -> int:
+        """Reads the standings cells the worker changed since `from_time`, all of them on the first call"""
+        query = cls.get_changed_cells(monitor, from_time)
+        size = len(TableCell.FIELDS)
+        changed = 0
+        for personality, problem, attempts, first_ok, *fields in query.iterator(chunk_size=cls.CHUNK_SIZE):
+            index, verdict, *shown = fields[:size] if first_ok is not None else fields[size:]
+            if index is None:
+                table.pop((personality, problem), None)
+            else:
+                table[(personality, problem)] = TableCell(attempts, index, Submit.VERDICTS[verdict], *shown)
+            changed += 1
+        return changed
 
-        for person in personalities:
-            for problem in problem_list:
-                table[(person, problem)].remove_until(from_time)
+    @classmethod
+    def read_table(cls, monitor: Monitor) -> dict[(int, int), TableCell]:
+        """The whole table from the standings cells, bypassing the cache"""
+        table = {}
+        cls.__update_table(monitor, table, cls.DEFAULT_DATETIME - cls.DEFAULT_DELTA)
+        return table
 
-            query = person.submit_set.filter(submission_time__gt=from_time).order_by('submission_time')
+    @classmethod
+    def get_archived_state(cls, monitor: Monitor) -> State or None:
+        """Table of a monitor whose submits were moved to MonitorArchive, None if there is no archive"""
+        archive = MonitorArchive.objects.filter(monitor=monitor).first()
+        if archive is None:
+            return None
+        state = cls.State()
+        state.archived = True
+        for personality, problem, *values in archive.unpack()['cells']:
+            state.table[(personality, problem)] = TableCell(*values)
+        return state
 
-            for submit in query.all():
-                table[(person, submit.problem)].add_submit(submit)
+    @staticmethod
+    def get_problems(monitor: Monitor) -> list[Problem]:
+        """Problems in the order of the table columns, with their contests and the monitor loaded"""
+        return list(
+            Problem.objects.filter(contest__monitor=monitor)
+            .select_related('contest__monitor')
+            .order_by('contest__index', 'index')
+        )
 
     @classmethod
     def gen(cls, monitor: Monitor):
-        problem_list = []
-        for contest in monitor.contest_set.all():
-            problem_list += list(contest.problem_set.all())
-        personalities = monitor.personality_set.filter(is_blacklisted=False).all()
-        table = cls._raw_tables[monitor]
+        problem_list = cls.get_problems(monitor)
+        personalities = list(monitor.personality_set.filter(is_blacklisted=False))
+
+        tables = caches[cls.CACHE]
+        state = tables.get(cls._get_key(monitor))
+        if state is not None and state.archived and \
+                (not monitor.is_old or not MonitorArchive.objects.filter(monitor=monitor).exists()):
+            # rehydrated in another process, whose refresh did not reach the cache of this one
+            state = None
+        if state is None and monitor.is_old:
+            state = cls.get_archived_state(monitor)
+            if state is not None:
+                tables.set(cls._get_key(monitor), state)
+        state = state or cls.State()
+        if not state.archived:
+            now = timezone.now()
+            changed = cls.__update_table(monitor, state.table, state.last_update - cls.DEFAULT_DELTA)
+            # an unchanged table is not written back, the next read just starts from a bit earlier
+            if changed or now - state.last_update > cls.DEFAULT_DELTA / 2:
+                state.last_update = now
+                tables.set(cls._get_key(monitor), state)
+        submission_urls = [problem.contest.get_submission_cf_url('') for problem in problem_list]
 
-        cls.__update_table(table, personalities, problem_list, cls._last_updates[monitor] - cls.DEFAULT_DELTA)
-        cls._last_updates[monitor] = timezone.now()
+        return cls.gen_rows(personalities, problem_list, state.table, submission_urls), problem_list
 
+    EMPTY_RESULT = ('', '#', None)
+
+    @classmethod
+    def get_results(cls, cells: list[TableCell or None], submission_urls: list[str]) -> list[tuple]:
+        """(attempts, link, cell) for every problem, as the template shows them"""
+        return [
+            cls.EMPTY_RESULT if cell is None else (cell.attempts, f'{submission_url}{cell.index}', cell)
+            for cell, submission_url in zip(cells, submission_urls)
+        ]
+
+    @classmethod
+    def gen_rows(cls,
+                 personalities: list[Personality],
+                 problem_list: list[Problem],
+                 table: dict[(int, int), TableCell],
+                 submission_urls: list[str]
+                 ) -> list[list]:
+        """Sorted (place, delta, personality, results, solved, practiced) rows"""
         result = []
+        problem_pks = [problem.pk for problem in problem_list]
 
         for person in personalities:
-            # todo: rewrite this shit
-            table_row = [0, 0, person, [], 0, 0]
-
-            for problem in problem_list:
-                count, submit = table[(person, problem)].get_result()
-                if submit is None:
-                    table_row[3].append(('', '#', None))
-                else:
-                    table_row[3].append((count, submit.get_cf_url(), submit))
-                    if submit.verdict == submit.OK:
-                        if not submit.is_contest:
-                            table_row[5] += 1
-                        table_row[4] += 1
+            person_pk = person.pk
+            cells = [table.get((person_pk, problem)) for problem in problem_pks]
+            table_row = [0, 0, person, cls.get_results(cells, submission_urls), 0, 0]
+            for cell in cells:
+                if cell is not None and cell.verdict == cell.OK:
+                    if not cell.is_contest:
+                        table_row[5] += 1
+                    table_row[4] += 1
 
             result.append(table_row)
 
-        for r in result:
-            r[0] = len([p for p in result if p[4] > r[4]]) + 1
-            r[1] = r[0] - len([p for p in result if p[4] - p[5] > r[4] - r[5]]) + 1
+        cls._rank(result)
+        return sorted(result, key=lambda x: x[:2])
+
+    @staticmethod
+    def _count_greater(values: list[int]) -> list[int]:
+        """For every value, the number of values strictly greater than it"""
+        ordered = sorted(values)
+        return [len(ordered) - bisect_right(ordered, value) for value in values]
+
+    @classmethod
+    def _rank(cls, result: list[list]):
+        """Fills the place by solved problems and its change against the place by contest-only solutions"""
+        better = cls._count_greater([r[4] for r in result])
+        better_on_contest = cls._count_greater([r[4] - r[5] for r in result])
+        for r, above, above_on_contest in zip(result, better, better_on_contest):
+            r[0] = above + 1
+            r[1] = r[0] - above_on_contest + 1
 
-        return sorted(result, key=lambda x: x[:2]), problem_list
+    @staticmethod
+    def get_version(monitor: Monitor) -> str:
+        """Token that changes whenever anything _monitor.html shows may have changed:
+        contests and their update times, problems, participants or standings cells.
+        Cells are only followed by the newest updated_at of every problem, one probe of
+        standings_problem_updated_idx each. Cells are deleted only together with their problem or participant,
+        or when the monitor is archived, and those are in the token already"""
+        digest = sha1(f'{monitor.pk}:{monitor.group}:{monitor.human_name}:{monitor.is_old}'.encode())
+        last_cell = StandingsCell.objects.filter(problem=OuterRef('pk')).order_by('-updated_at').values('updated_at')
+        parts = [
+            monitor.contest_set.values_list('pk', 'index', 'cf_contest', 'human_name', 'last_status_update'),
+            Problem.objects.filter(contest__monitor=monitor).order_by('pk').annotate(
+                last_cell=Subquery(last_cell[:1])
+            ).values_list('pk', 'last_cell'),
+            monitor.personality_set.order_by('pk').values_list('pk', 'real_name', 'is_blacklisted'),
+        ]
+        for rows in parts:
+            for row in rows:
+                digest.update(repr(row).encode())
+        return digest.hexdigest()
 
     @classmethod
     def refresh(cls, monitor: Monitor):
-        cls._last_updates[monitor] = cls.DEFAULT_DATETIME
+        caches[cls.CACHE].delete(cls._get_key(monitor))
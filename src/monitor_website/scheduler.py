@@ -0,0 +1,104 @@
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Contest, Personality
+
+
+class ContestPlan:
+    """Scheduling decision for one contest, shown on the worker queue page"""
+
+    def __init__(self, contest: Contest, interval: timezone.timedelta, priority: float, reason: str):
+        self.contest = contest
+        self.interval = interval
+        self.priority = priority
+        self.reason = reason
+        self.round = float('inf')
+
+    def is_due(self):
+        return self.priority >= 1
+
+    def due_time(self):
+        if self.contest.last_status_update is None:
+            return None
+        return self.contest.last_status_update + self.interval
+
+
+class ContestScheduler:
+    """Polls contests with fresh pings, frequent submissions and many participants more often,
+    backs off contests that keep failing and takes due contests from all monitors in turn"""
+
+    MIN_INTERVAL = timezone.timedelta(seconds=20)
+    MAX_INTERVAL = timezone.timedelta(minutes=5)
+    PING_DELTA = timezone.timedelta(minutes=20)
+    RATE_HALF = 1.  # new submissions per minute that make half of the rate heat
+    SIZE_HALF = 50  # participants that make half of the size heat
+    RATE_SMOOTHING = 0.3
+    MAX_BACKOFF = 5
+
+    @staticmethod
+    def get_monitor_sizes(contests: list[Contest]) -> dict[int, int]:
+        return dict(Personality.objects.filter(
+            monitor_id__in={contest.monitor_id for contest in contests},
+            is_blacklisted=False
+        ).values('monitor').annotate(n=Count('pk')).values_list('monitor', 'n'))
+
+    @classmethod
+    def get_interval(cls, contest: Contest, monitor_size: int, now: timezone.datetime) -> timezone.timedelta:
+        # a bound set on the contest wins over the opposite default one
+        min_interval = contest.min_poll_interval or min(cls.MIN_INTERVAL, contest.max_poll_interval or cls.MIN_INTERVAL)
+        max_interval = contest.max_poll_interval or max(cls.MAX_INTERVAL, min_interval)
+
+        ping_age = now - contest.last_ping if contest.last_ping else cls.PING_DELTA
+        ping_heat = max(0., 1 - ping_age / cls.PING_DELTA)
+        rate_heat = contest.submission_rate / (contest.submission_rate + cls.RATE_HALF)
+        size_heat = monitor_size / (monitor_size + cls.SIZE_HALF)
+        heat = ping_heat * (0.5 + 0.35 * rate_heat + 0.15 * size_heat)
+
+        interval = max_interval - (max_interval - min_interval) * heat
+        return min(max_interval, interval * 2 ** min(contest.fail_count, cls.MAX_BACKOFF))
+
+    @classmethod
+    def _get_reason(cls, contest: Contest, now: timezone.datetime):
+        if contest.monitor.is_old:
+            return 'Монитор не обновляется'
+        if contest.error_text is not None:
+            return 'Ошибка'
+        if contest.last_ping is None or contest.last_ping < now - cls.PING_DELTA:
+            return 'Монитор давно не открывали'
+        if contest.is_leased():
+            return f'Обновляется воркером {contest.lease_owner}'
+        return ''
+
+    @classmethod
+    def plan(cls, contests: list[Contest]) -> list[ContestPlan]:
+        """Due contests go first, one contest of every monitor per round, then the rest by priority"""
+        now = timezone.now()
+        sizes = cls.get_monitor_sizes(contests)
+
+        plans = []
+        for contest in contests:
+            interval = cls.get_interval(contest, sizes.get(contest.monitor_id, 0), now)
+            reason = cls._get_reason(contest, now)
+            if reason:
+                priority = 0.
+            elif contest.last_status_update is None:
+                priority = float('inf')
+            else:
+                priority = (now - contest.last_status_update) / interval
+            plans.append(ContestPlan(contest, interval, priority, reason))
+
+        plans.sort(key=lambda p: p.priority, reverse=True)
+        rounds = {}
+        for p in plans:
+            if p.is_due():
+                p.round = rounds[p.contest.monitor_id] = rounds.get(p.contest.monitor_id, -1) + 1
+        plans.sort(key=lambda p: p.round)
+        return plans
+
+    @classmethod
+    def observe(cls, contest: Contest, changed: int, now: timezone.datetime):
+        """Updates the submission rate estimate after a successful refresh"""
+        if contest.last_status_update is not None:
+            minutes = max((now - contest.last_status_update).total_seconds() / 60, 1 / 60)
+            contest.submission_rate += cls.RATE_SMOOTHING * (changed / minutes - contest.submission_rate)
+        contest.fail_count = 0
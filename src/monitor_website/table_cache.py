@@ -0,0 +1,93 @@
+import pickle
+import threading
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class BoundedMemoryCache(LocMemCache):
+    """Local memory cache that keeps the values themselves instead of their pickles, so a big monitor table
+    is not unpickled on every poll. A value that was read must not be changed unless it is set back.
+    Evicts the least recently used entries once their size exceeds OPTIONS['MAX_BYTES']. The size of a value
+    is what its get_cache_size() says, the length of its pickle otherwise.
+    The newest entry is kept even if it alone is bigger than the cap"""
+
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    _sizes: dict[str, dict[str, int]] = {}
+    _sizes_lock = threading.Lock()
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._max_bytes = int(params.get('OPTIONS', {}).get('MAX_BYTES', self.DEFAULT_MAX_BYTES))
+        with self._sizes_lock:
+            self._entry_sizes = self._sizes.setdefault(name, {})
+
+    def _get_value_size(self, value) -> int:
+        if hasattr(value, 'get_cache_size'):
+            return value.get_cache_size()
+        return len(pickle.dumps(value, self.pickle_protocol))
+
+    def get_size(self):
+        with self._lock:
+            return sum(self._entry_sizes.get(key, 0) for key in self._cache)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        size = self._get_value_size(value)
+        with self._lock:
+            if self._has_expired(key):
+                self._set(key, value, timeout, size)
+                return True
+            return False
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if self._has_expired(key):
+                self._delete(key)
+                return default
+            self._cache.move_to_end(key, last=False)
+            return self._cache[key]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        size = self._get_value_size(value)
+        with self._lock:
+            self._set(key, value, timeout, size)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._lock:
+            if self._has_expired(key):
+                self._delete(key)
+                raise ValueError(f"Key '{key}' not found")
+            value = self._cache[key] + delta
+            self._cache[key] = value
+            self._cache.move_to_end(key, last=False)
+        return value
+
+    def _set(self, key, value, timeout=DEFAULT_TIMEOUT, size=0):
+        super()._set(key, value, timeout)
+        self._entry_sizes[key] = size
+
+        size = sum(self._entry_sizes.get(k, 0) for k in self._cache)
+        while size > self._max_bytes and len(self._cache) > 1:
+            oldest, _ = self._cache.popitem()
+            del self._expire_info[oldest]
+            size -= self._entry_sizes.pop(oldest, 0)
+
+    def _cull(self):
+        super()._cull()
+        for key in self._entry_sizes.keys() - self._cache.keys():
+            del self._entry_sizes[key]
+
+    def _delete(self, key):
+        self._entry_sizes.pop(key, None)
+        return super()._delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._expire_info.clear()
+            self._entry_sizes.clear()
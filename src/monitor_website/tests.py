@@ -1,3 +1,1186 @@
-from django.test import TestCase
+import json
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from unittest import skipUnless
+from types import SimpleNamespace
+from unittest.mock import patch
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import requests
+
+from .archive import MonitorArchiver
+from .cf_fake import FakeCodeforcesAdapter, FakeContest
+from .cf_worker import CodeforcesAPIManager, CodeforcesWorker, PingBuffer, TokenBucket, ping
+from .events import MonitorEvents
+from .ingest import IngestContext, StandingsBuilder, SubmissionBatch, UnknownProblemError
+from .json_stream import JsonArrayStream
+from .models import Contest, Monitor, MonitorArchive, Personality, Problem, StandingsCell, Submit
+from .monitor_gen import MonitorGenerator, TableCell
+from .scheduler import ContestScheduler
+from .table_cache import BoundedMemoryCache
+
+
+def create_monitor(contests=2, problems=3) -> Monitor:
+    monitor = Monitor(human_name='Тестовый монитор')
+    monitor.save()
+    for c in range(contests):
+        contest = Contest.objects.create(monitor=monitor, cf_contest=f'{100 + c}')
+        for p in range(problems):
+            Problem.objects.create(contest=contest, index=chr(ord('A') + p), name=f'Задача {p}')
+    return monitor
+
+
+WA = Submit.VERDICT_CODES['WA']
+TL = Submit.VERDICT_CODES['TL']
+
+
+def submit_index(i: int, j: int, k: int) -> int:
+    """Index of the k-th submit of participant i on problem j"""
+    return (i + 1) * 1000 + j * 10 + k
+
+
+def add_participants(monitor: Monitor, count: int, start=0):
+    problems = list(Problem.objects.filter(contest__monitor=monitor).order_by('contest__index', 'index'))
+    time = timezone.now() - timezone.timedelta(days=1)
+    submits = []
+    for i in range(start, start + count):
+        person = Personality.objects.create(monitor=monitor, nickname=f'user{i}')
+        for j, problem in enumerate(problems):
+            for k, verdict in enumerate([WA, Submit.OK] if (i + j) % 2 else [WA]):
+                submits.append(Submit(
+                    index=submit_index(i, j, k), contest_id=problem.contest_id, problem=problem, personality=person,
+                    is_contest=True, verdict=verdict,
+                    submission_time=time + timezone.timedelta(minutes=i + j + k)
+                ))
+    Submit.objects.bulk_create(submits)
+    StandingsBuilder.rebuild({(submit.problem.pk, submit.personality.pk) for submit in submits})
+
+
+class MonitorGeneratorTest(TestCase):
+    def setUp(self):
+        self.monitor = create_monitor()
+
+    def tearDown(self):
+        MonitorGenerator.refresh(self.monitor)
+
+    def _count_gen_queries(self):
+        MonitorGenerator.refresh(self.monitor)
+        with CaptureQueriesContext(connection) as queries:
+            MonitorGenerator.gen(self.monitor)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_participants(self):
+        add_participants(self.monitor, 3)
+        few = self._count_gen_queries()
+        add_participants(self.monitor, 40, start=3)
+        many = self._count_gen_queries()
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, 3)
+
+    def test_blacklisted_participants_are_skipped(self):
+        add_participants(self.monitor, 4)
+        Personality.objects.filter(nickname='user0').update(is_blacklisted=True)
+        rows, problem_list = MonitorGenerator.gen(self.monitor)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(len(problem_list), 6)
+        self.assertNotIn('user0', [row[2].nickname for row in rows])
+
+    def test_results(self):
+        add_participants(self.monitor, 2)
+        rows, problem_list = MonitorGenerator.gen(self.monitor)
+        self.assertEqual([p.contest.cf_contest for p in problem_list], ['100'] * 3 + ['101'] * 3)
+        for _, _, person, results, solved, _ in rows:
+            i = int(person.nickname[4:])
+            for j, (count, link, submit) in enumerate(results):
+                self.assertEqual(count, 1)
+                self.assertEqual(submit.verdict, TableCell.OK if (i + j) % 2 else 'WA')
+                self.assertIn(f'/submission/{submit.index}', link)
+            self.assertEqual(solved, 3)
+
+    def test_changed_cells_are_read_incrementally(self):
+        add_participants(self.monitor, 2)
+        rows, _ = MonitorGenerator.gen(self.monitor)
+        self.assertEqual([row[4] for row in rows], [3, 3])
+
+        submit = Submit.objects.get(index=submit_index(0, 0, 0))
+        submit.verdict = Submit.OK
+        submit.save()
+        StandingsBuilder.rebuild({(submit.problem_id, submit.personality_id)})
+        rows, _ = MonitorGenerator.gen(self.monitor)
+        self.assertEqual([row[4] for row in rows], [4, 3])
+        self.assertEqual(rows[0][3][0][0], 0)
+
+
+class StandingsBuilderTest(TestCase):
+    def test_summarize(self):
+        cell = StandingsBuilder.summarize(1, 2, [(10, WA, True), (11, TL, True), (12, Submit.OK, False), (13, Submit.OK, True)])
+        self.assertEqual((cell.attempts, cell.first_ok_id, cell.is_contest, cell.last_submit_id), (2, 12, False, 13))
+
+        cell = StandingsBuilder.summarize(1, 2, [(10, WA, True), (11, Submit.VERDICT_CODES['testing'], True)])
+        self.assertEqual((cell.attempts, cell.first_ok_id, cell.last_submit_id), (2, None, 11))
+
+    def test_rebuild_only_touches_given_pairs(self):
+        monitor = create_monitor(1, 2)
+        add_participants(monitor, 2)
+        StandingsCell.objects.all().delete()
+        a, b = Problem.objects.filter(contest__monitor=monitor).order_by('index')
+        person = Personality.objects.get(nickname='user0')
+        StandingsBuilder.rebuild({(a.pk, person.pk)})
+        cell = StandingsCell.objects.get()
+        self.assertEqual((cell.problem_id, cell.personality_id, cell.attempts), (a.pk, person.pk, 1))
+
+    def test_prune_keeps_the_shown_submits(self):
+        monitor = create_monitor(1, 1)
+        problem = Problem.objects.get(contest__monitor=monitor)
+        person = Personality.objects.create(monitor=monitor, nickname='user0')
+        time = timezone.now() - timezone.timedelta(days=1)
+        verdicts = [WA, TL, Submit.VERDICT_CODES['testing'], Submit.OK, WA, Submit.OK, WA]
+        Submit.objects.bulk_create([
+            Submit(index=i + 1, contest_id=problem.contest_id, problem=problem, personality=person, is_contest=False,
+                   verdict=verdict, submission_time=time + timezone.timedelta(minutes=i))
+            for i, verdict in enumerate(verdicts)
+        ])
+        pair = (problem.pk, person.pk)
+        StandingsBuilder.rebuild({pair})
+
+        self.assertEqual(StandingsBuilder.prune({pair}), {pair: 6})
+        self.assertEqual(sorted(Submit.objects.values_list('index', flat=True)), [3, 4, 7])
+        StandingsBuilder.rebuild({pair})
+        cell = StandingsCell.objects.get()
+        self.assertEqual((cell.attempts, cell.pruned, cell.first_ok.index), (3, 2, 4))
+
+        context = IngestContext(problem.contest, since=None)
+        self.assertTrue(context.is_pruned(2, 'user0', ('A', 'Задача 0')))
+        self.assertFalse(context.is_pruned(8, 'user0', ('A', 'Задача 0')))
+
+
+def cf_submission(index: int, handle: str, problem='A', verdict='WRONG_ANSWER') -> dict:
+    """contest.status row of a problem of create_monitor"""
+    return {
+        'id': index,
+        'creationTimeSeconds': 1660000000 + index,
+        'problem': {'index': problem, 'name': f'Задача {ord(problem) - ord("A")}'},
+        'author': {'participantType': 'CONTESTANT', 'members': [{'handle': handle}]},
+        'programmingLanguage': 'Python 3',
+        'verdict': verdict,
+        'passedTestCount': 2,
+        'timeConsumedMillis': 15,
+    }
+
+
+class SubmissionBatchTest(TestCase):
+    def setUp(self):
+        self.monitor = create_monitor(contests=1, problems=2)
+        self.contest = self.monitor.contest_set.get()
+
+    def _flush(self, submissions: list[dict]) -> SubmissionBatch:
+        batch = SubmissionBatch(IngestContext(self.contest))
+        for submission in submissions:
+            batch.add(submission, CodeforcesWorker._submission_fields(submission))
+        batch.flush()
+        return batch
+
+    def test_inserted_and_updated_are_counted(self):
+        batch = self._flush([cf_submission(1, 'a'), cf_submission(2, 'b'), cf_submission(3, 'a', 'B', 'OK')])
+        self.assertEqual((batch.inserted, batch.updated, batch.skipped), (3, 0, 0))
+
+        batch = self._flush([cf_submission(1, 'a', verdict='OK'), cf_submission(2, 'b'), cf_submission(4, 'b')])
+        self.assertEqual((batch.inserted, batch.updated, batch.skipped), (1, 1, 1))
+        self.assertEqual(Submit.objects.get(index=1).verdict, Submit.OK)
+        cell = StandingsCell.objects.get(personality__nickname='a', problem__index='A')
+        self.assertEqual((cell.attempts, cell.first_ok.index), (0, 1))
+
+    @patch.object(SubmissionBatch, 'CHUNK_SIZE', 2)
+    def test_rows_are_written_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            batch = self._flush([cf_submission(i, f'user{i % 3}') for i in range(1, 6)])
+        self.assertEqual(batch.inserted, 5)
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "monitor_website_submit"')]
+        self.assertEqual(len(inserts), 3)
+
+    def test_missing_personalities_are_created_at_once(self):
+        Personality.objects.create(monitor=self.monitor, nickname='known')
+        with CaptureQueriesContext(connection) as queries:
+            self._flush([cf_submission(i, handle) for i, handle in enumerate(['known', 'new1', 'new2', 'new1'], 1)])
+        inserts = [q for q in queries.captured_queries
+                   if q['sql'].startswith('INSERT') and '"monitor_website_personality"' in q['sql']]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(set(self.monitor.personality_set.filter(is_blacklisted=True).values_list('nickname', flat=True)),
+                         {'new1', 'new2'})
+
+    def test_unknown_problem_rolls_the_batch_back(self):
+        with self.assertRaises(UnknownProblemError):
+            self._flush([cf_submission(1, 'a'), cf_submission(2, 'b', 'Z')])
+        self.assertFalse(Submit.objects.exists())
+        self.assertFalse(Personality.objects.exists())
+        self.assertFalse(StandingsCell.objects.exists())
+
+
+def plain(rows):
+    return [
+        (index, delta, person.pk, [(count, url, submit and submit.verdict) for count, url, submit in results], *totals)
+        for index, delta, person, results, *totals in rows
+    ]
+
+
+def rank_quadratic(result):
+    """Ranking as MonitorGenerator.gen did it before, kept as the reference"""
+    for r in result:
+        r[0] = len([p for p in result if p[4] > r[4]]) + 1
+        r[1] = r[0] - len([p for p in result if p[4] - p[5] > r[4] - r[5]]) + 1
+
+
+class RankingTest(SimpleTestCase):
+    def _random_table(self, rng: random.Random, size: int, problems: int):
+        table = []
+        for i in range(size):
+            solved = rng.randint(0, problems)
+            table.append([0, 0, f'user{i}', [], solved, rng.randint(0, solved)])
+        return table
+
+    def test_matches_reference_on_random_tables(self):
+        rng = random.Random(12)
+        for _ in range(300):
+            table = self._random_table(rng, rng.randint(0, 60), rng.choice([0, 1, 3, 10, 40]))
+            expected = [row[:] for row in table]
+            rank_quadratic(expected)
+            MonitorGenerator._rank(table)
+            self.assertEqual(table, expected)
+
+    def test_ties(self):
+        table = [[0, 0, 'a', [], 2, 0], [0, 0, 'b', [], 2, 2], [0, 0, 'c', [], 1, 0], [0, 0, 'd', [], 2, 1]]
+        MonitorGenerator._rank(table)
+        self.assertEqual([row[:2] for row in table], [[1, 2], [1, -1], [4, 4], [1, 1]])
+
+    def test_empty(self):
+        table = []
+        MonitorGenerator._rank(table)
+        self.assertEqual(table, [])
+
+
+@override_settings(WORKER_EMBEDDED=0)
+class MonitorInsideTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.monitor = create_monitor()
+        add_participants(self.monitor, 3)
+        self.url = reverse('main:monitor_inside', kwargs={'monitor_id': self.monitor.pk})
+
+    def tearDown(self):
+        MonitorGenerator.refresh(self.monitor)
+
+    def test_unchanged_monitor_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_authenticated_viewer_gets_submission_links(self):
+        self.client.force_login(User.objects.create_user('teacher'))
+        response = self.client.get(self.url)
+        self.assertContains(response, f'/contest/100/submission/{submit_index(0, 0, 0)}"')
+
+    def test_fragment_is_reused_until_the_version_changes(self):
+        first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        self.assertFalse(any('standingscell"."attempts' in q['sql'] for q in queries.captured_queries))
+
+        Personality.objects.filter(nickname='user1').update(real_name='Иван')
+        third = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(third.status_code, 200)
+        self.assertNotEqual(third['ETag'], first['ETag'])
+        self.assertIn('Иван', third.content.decode())
+
+    def test_version_follows_cells_without_counting_them(self):
+        version = MonitorGenerator.get_version(self.monitor)
+        submit = Submit.objects.get(index=submit_index(1, 2, 0))
+        with patch('django.utils.timezone.now', return_value=timezone.now() + timezone.timedelta(seconds=1)):
+            StandingsBuilder.rebuild({(submit.problem_id, submit.personality_id)})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertNotEqual(MonitorGenerator.get_version(self.monitor), version)
+        self.assertFalse(any('COUNT(' in q['sql'] for q in queries.captured_queries))
+
+        version = MonitorGenerator.get_version(self.monitor)
+        self.monitor.is_old = True
+        self.assertNotEqual(MonitorGenerator.get_version(self.monitor), version)
+
+
+@skipUnless(shutil.which('node'), 'scripts are syntax-checked by Node.js')
+@override_settings(WORKER_EMBEDDED=0)
+class MonitorPageScriptTest(TestCase):
+    """The standings of monitor.html are only loaded by its inline script, so a syntax error leaves the page empty"""
+
+    def test_inline_scripts_parse(self):
+        monitor = create_monitor()
+        content = self.client.get(reverse('main:monitor', kwargs={'monitor_id': monitor.pk})).content.decode()
+        scripts = re.findall(r'<script>(.*?)</script>', content, re.DOTALL)
+        self.assertTrue(any('apply_diff' in script for script in scripts))
+        for script in scripts:
+            with tempfile.NamedTemporaryFile('w', suffix='.js') as file:
+                file.write(script)
+                file.flush()
+                checked = subprocess.run(['node', '--check', file.name], capture_output=True, text=True)
+            self.assertEqual(checked.returncode, 0, checked.stderr)
+
+
+@override_settings(WORKER_EMBEDDED=0)
+class MonitorDiffTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        caches['monitor_tables'].clear()
+        self.monitor = create_monitor()
+        add_participants(self.monitor, 3)
+        self.url = reverse('main:monitor_diff', kwargs={'monitor_id': self.monitor.pk})
+
+    def tearDown(self):
+        MonitorGenerator.refresh(self.monitor)
+
+    def _load(self):
+        return self.client.get(reverse('main:monitor_inside', kwargs={'monitor_id': self.monitor.pk}))['X-Monitor-Version']
+
+    def _solve(self, index):
+        submit = Submit.objects.get(index=index)
+        submit.verdict = Submit.OK
+        submit.save()
+        StandingsBuilder.rebuild({(submit.problem_id, submit.personality_id)})
+        return submit
+
+    def test_unchanged_version_gets_empty_diff(self):
+        version = self._load()
+        diff = self.client.get(self.url, {'since': version}).json()
+        self.assertEqual(diff, {'version': version, 'cells': [], 'ranks': []})
+
+    def test_only_changed_cell_and_places_are_sent(self):
+        version = self._load()
+        submit = self._solve(submit_index(0, 0, 0))
+        diff = self.client.get(self.url, {'since': version}).json()
+
+        self.assertNotEqual(diff['version'], version)
+        [[pk, column, html]] = diff['cells']
+        self.assertEqual((pk, column), (submit.personality_id, 0))
+        self.assertIn('table-success', html)
+        self.assertEqual([(place, solved) for _, place, _, solved, _ in diff['ranks']], [(1, 4), (2, 3), (2, 3)])
+        self.assertEqual(diff['order'][0], submit.personality_id)
+
+    def test_unknown_version_gets_full_reload(self):
+        self._load()
+        diff = self.client.get(self.url, {'since': 'stale'}).json()
+        self.assertTrue(diff['full'])
+
+    def test_snapshots_are_shared_through_the_tables_cache(self):
+        version = self._load()
+        self.assertIsNotNone(caches['monitor_tables'].get(f'monitor_snapshot:{self.monitor.pk}:{version}'))
+        # another process has its own default cache, but the same tables cache
+        cache.clear()
+        self._solve(submit_index(0, 0, 0))
+        diff = self.client.get(self.url, {'since': version}).json()
+        self.assertNotIn('full', diff)
+        self.assertEqual(len(diff['cells']), 1)
+
+    def test_new_participant_gets_full_reload(self):
+        version = self._load()
+        add_participants(self.monitor, 1, start=3)
+        self.assertTrue(self.client.get(self.url, {'since': version}).json()['full'])
+
+
+@override_settings(WORKER_EMBEDDED=0)
+class MonitorEventsTest(TestCase):
+    def setUp(self):
+        self.monitor = create_monitor()
+        add_participants(self.monitor, 2)
+        self.url = reverse('main:monitor_events', kwargs={'monitor_id': self.monitor.pk})
+
+    def test_wsgi_clients_keep_polling(self):
+        self.assertEqual(self.client.get(self.url).status_code, 204)
+
+    @patch.object(MonitorEvents, 'POLL_SECONDS', 0.01)
+    async def test_change_is_pushed(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.streaming_content.__aiter__()
+        self.assertIn(b'retry', await events.__anext__())
+        self.assertEqual(await events.__anext__(), b': keepalive\n\n')
+
+        await Personality.objects.filter(nickname='user1').aupdate(real_name='Иван')
+        self.assertEqual(await events.__anext__(), b'event: changed\ndata: \n\n')
+        await events.aclose()
+
+
+@override_settings(WORKER_EMBEDDED=0)
+class QueryBudgetTest(TestCase):
+    """Pages make the same few queries whatever the number of problems, participants and monitors"""
+
+    def _count_queries(self, name, **kwargs):
+        cache.clear()
+        PingBuffer.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name, kwargs=kwargs))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def _assert_budget(self, name, budget):
+        small = create_monitor(contests=1, problems=1)
+        add_participants(small, 1)
+        big = create_monitor(contests=4, problems=4)
+        add_participants(big, 30)
+
+        counts = [self._count_queries(name, monitor_id=monitor.pk) for monitor in (small, big)]
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[1], budget)
+        for monitor in small, big:
+            MonitorGenerator.refresh(monitor)
+
+    def test_monitor_inside(self):
+        self._assert_budget('main:monitor_inside', 9)
+
+    def test_monitor_inside_authenticated(self):
+        self.client.force_login(User.objects.create_user('teacher'))
+        self._assert_budget('main:monitor_inside', 11)
+
+    def test_monitor_page(self):
+        self._assert_budget('main:monitor', 4)
+
+    def test_monitor_edit(self):
+        self.client.force_login(User.objects.create_user('teacher'))
+        self._assert_budget('main:monitor_edit', 7)
+
+    def test_home(self):
+        self.client.force_login(User.objects.create_superuser('admin'))
+        create_monitor()
+        few = self._count_queries('main:home')
+        for _ in range(5):
+            create_monitor()
+        self.assertEqual(self._count_queries('main:home'), few)
+        self.assertLessEqual(few, 3)
+
+
+@override_settings(WORKER_EMBEDDED=0)
+class PingBufferTest(TestCase):
+    def setUp(self):
+        PingBuffer.clear()
+
+    def test_pings_are_written_once_per_flush_delta(self):
+        first, second = create_monitor(), create_monitor()
+        with CaptureQueriesContext(connection) as queries:
+            ping(first)
+            ping(second)
+            ping(first)
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(Contest.objects.filter(last_ping__isnull=False).count(), 4)
+
+        written = Contest.objects.filter(monitor=first).first().last_ping
+        later = timezone.now() + PingBuffer.FLUSH_DELTA
+        with patch('django.utils.timezone.now', return_value=later), CaptureQueriesContext(connection) as queries:
+            ping(second)
+        self.assertEqual(len(queries), 1)
+        # the pending ping of the first monitor went with the same UPDATE
+        self.assertGreater(Contest.objects.filter(monitor=first).first().last_ping, written)
+        self.assertEqual(Contest.objects.filter(monitor=second).first().last_ping, later)
+
+
+class SchedulerIntervalTest(SimpleTestCase):
+    MIN, MAX = ContestScheduler.MIN_INTERVAL, ContestScheduler.MAX_INTERVAL
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def get_interval(self, size=0, **fields) -> timezone.timedelta:
+        contest = Contest(**{'last_ping': self.now, **fields})
+        return ContestScheduler.get_interval(contest, size, self.now)
+
+    def test_ping_heat(self):
+        self.assertEqual(self.get_interval(last_ping=None), self.MAX)
+        self.assertEqual(self.get_interval(last_ping=self.now - ContestScheduler.PING_DELTA), self.MAX)
+        self.assertEqual(self.get_interval(), self.MAX - (self.MAX - self.MIN) * 0.5)
+        self.assertLess(self.get_interval(), self.get_interval(last_ping=self.now - ContestScheduler.PING_DELTA / 2))
+
+    def test_rate_and_size_heat(self):
+        quiet = self.get_interval()
+        self.assertLess(self.get_interval(submission_rate=ContestScheduler.RATE_HALF), quiet)
+        self.assertLess(self.get_interval(size=ContestScheduler.SIZE_HALF), quiet)
+        hottest = self.get_interval(size=10 ** 9, submission_rate=10 ** 9)
+        self.assertAlmostEqual(hottest.total_seconds(), self.MIN.total_seconds(), places=3)
+
+    def test_failures_back_off_up_to_the_cap(self):
+        hot = {'size': 10 ** 9, 'submission_rate': 10 ** 9}
+        interval = self.get_interval(**hot)
+        self.assertEqual(self.get_interval(fail_count=1, **hot), interval * 2)
+        self.assertEqual(self.get_interval(fail_count=3, **hot), interval * 8)
+        self.assertEqual(self.get_interval(fail_count=4, **hot), self.MAX)
+
+        day = timezone.timedelta(days=1)
+        capped = self.get_interval(fail_count=ContestScheduler.MAX_BACKOFF, max_poll_interval=day, **hot)
+        self.assertEqual(self.get_interval(fail_count=100, max_poll_interval=day, **hot), capped)
+        self.assertLess(capped, day)
+
+    def test_contest_bounds(self):
+        low, high = timezone.timedelta(minutes=1), timezone.timedelta(minutes=2)
+        self.assertEqual(self.get_interval(last_ping=None, min_poll_interval=low, max_poll_interval=high), high)
+        self.assertEqual(self.get_interval(min_poll_interval=low, max_poll_interval=high), (low + high) / 2)
+        self.assertEqual(self.get_interval(fail_count=5, min_poll_interval=low, max_poll_interval=high), high)
+
+    def test_one_contest_bound_beyond_the_other_default(self):
+        hour, second = timezone.timedelta(hours=1), timezone.timedelta(seconds=1)
+        self.assertEqual(self.get_interval(min_poll_interval=hour), hour)
+        self.assertEqual(self.get_interval(last_ping=None, min_poll_interval=hour), hour)
+        self.assertEqual(self.get_interval(fail_count=3, min_poll_interval=hour), hour)
+        self.assertEqual(self.get_interval(max_poll_interval=second), second)
+        self.assertEqual(self.get_interval(size=10 ** 9, submission_rate=10 ** 9, max_poll_interval=second), second)
+
+
+class SchedulerPlanTest(TestCase):
+    def create_contests(self, monitor: Monitor, count: int, **fields) -> list[Contest]:
+        return [
+            Contest.objects.create(monitor=monitor, cf_contest=f'{monitor.pk}{i}', last_ping=timezone.now(), **fields)
+            for i in range(count)
+        ]
+
+    def test_due_contests_of_monitors_are_taken_in_turn(self):
+        busy, quiet = Monitor(human_name='Много контестов'), Monitor(human_name='Один контест')
+        busy.save()
+        quiet.save()
+        # never polled contests are the most urgent, yet they do not hold back the other monitor
+        never = self.create_contests(busy, 3)
+        late = self.create_contests(quiet, 1, last_status_update=timezone.now() - timezone.timedelta(hours=1))
+        fresh = self.create_contests(quiet, 1, last_status_update=timezone.now())
+
+        plans = ContestScheduler.plan(list(Contest.objects.select_related('monitor')))
+        self.assertEqual([p.contest.monitor_id for p in plans[:2]], [busy.pk, quiet.pk])
+        self.assertEqual(plans[1].contest, late[0])
+        self.assertEqual({p.contest for p in plans[2:4]}, set(never[1:]))
+        self.assertEqual(plans[4].contest, fresh[0])
+        self.assertFalse(plans[4].is_due())
+
+    def test_contests_with_reasons_are_not_due(self):
+        monitor = Monitor(human_name='Монитор')
+        monitor.save()
+        self.create_contests(monitor, 1, error_text='Ошибка')
+        self.create_contests(monitor, 1, leased_until=timezone.now() + timezone.timedelta(minutes=1))
+        plans = ContestScheduler.plan(list(Contest.objects.select_related('monitor')))
+        self.assertEqual({p.reason for p in plans}, {'Ошибка', 'Обновляется воркером '})
+        self.assertFalse(any(p.is_due() for p in plans))
+
+    @override_settings(WORKER_EMBEDDED=0)
+    def test_poll_bounds_are_set_on_the_edit_page(self):
+        monitor = create_monitor(contests=1)
+        contest = monitor.contest_set.get()
+        url = reverse('main:monitor_edit', kwargs={'monitor_id': monitor.pk})
+        self.client.force_login(User.objects.create_user('teacher'))
+
+        self.client.post(url, {'query_type': 'poll', 'contest': contest.cf_contest, 'min_seconds': '60', 'max_seconds': ''})
+        contest.refresh_from_db()
+        self.assertEqual(contest.min_poll_interval, timezone.timedelta(minutes=1))
+        self.assertIsNone(contest.max_poll_interval)
+
+        response = self.client.post(url, {'query_type': 'poll', 'contest': contest.cf_contest,
+                                          'min_seconds': '60', 'max_seconds': '30'})
+        self.assertContains(response, 'больше интервала')
+        contest.refresh_from_db()
+        self.assertIsNone(contest.max_poll_interval)
+
+
+class MonitorArchiverTest(TestCase):
+    def setUp(self):
+        self.monitor = create_monitor()
+        add_participants(self.monitor, 4)
+        self.monitor.is_old = True
+        self.monitor.save()
+        self.submits = set(Submit.objects.values_list('index', 'problem_id', 'personality_id', 'verdict'))
+        self.rows = plain(MonitorGenerator.gen(self.monitor)[0])
+
+    def tearDown(self):
+        MonitorGenerator.refresh(self.monitor)
+
+    def test_archived_monitor_is_served_from_the_archive(self):
+        archive = MonitorArchiver.archive(self.monitor)
+        self.assertEqual(archive.submits, len(self.submits))
+        self.assertFalse(Submit.objects.exists())
+        self.assertFalse(StandingsCell.objects.exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(plain(MonitorGenerator.gen(self.monitor)[0]), self.rows)
+        self.assertFalse(any('standingscell' in q['sql'] for q in queries.captured_queries))
+
+    def test_rehydrate_restores_submits_and_cells(self):
+        MonitorArchiver.archive(self.monitor)
+        self.assertEqual(MonitorArchiver.rehydrate(self.monitor), len(self.submits))
+        self.assertEqual(set(Submit.objects.values_list('index', 'problem_id', 'personality_id', 'verdict')),
+                         self.submits)
+        self.assertFalse(MonitorArchive.objects.exists())
+        self.assertEqual(plain(MonitorGenerator.gen(self.monitor)[0]), self.rows)
+
+    def test_pruned_attempts_survive_the_archive(self):
+        StandingsBuilder.prune_monitor(self.monitor)
+        self.assertEqual(plain(MonitorGenerator.gen(self.monitor)[0]), self.rows)
+        MonitorArchiver.archive(self.monitor)
+        MonitorArchiver.rehydrate(self.monitor)
+        self.assertEqual(plain(MonitorGenerator.gen(self.monitor)[0]), self.rows)
+
+    def test_contest_leased_by_worker_is_not_archived(self):
+        self.monitor.contest_set.update(leased_until=timezone.now() + timezone.timedelta(minutes=1))
+        with self.assertRaises(MonitorArchiver.ContestsLeased):
+            MonitorArchiver.archive(self.monitor)
+        self.assertEqual(Submit.objects.count(), len(self.submits))
+
+    @override_settings(WORKER_EMBEDDED=0)
+    def test_skipped_archiving_is_shown_to_the_admin(self):
+        self.monitor.is_old = False
+        self.monitor.save()
+        self.monitor.contest_set.update(leased_until=timezone.now() + timezone.timedelta(minutes=1))
+        self.client.force_login(User.objects.create_user('teacher'))
+        response = self.client.post(reverse('main:monitor_edit', kwargs={'monitor_id': self.monitor.pk}),
+                                    {'query_type': 'worker'})
+        self.assertContains(response, f'archive_monitors {self.monitor.pk}')
+        self.assertFalse(MonitorArchive.objects.exists())
+
+    @override_settings(WORKER_EMBEDDED=0)
+    def test_saving_an_archived_monitor_shows_no_warning(self):
+        MonitorArchiver.archive(self.monitor)
+        self.assertIsNone(MonitorArchiver.archive(self.monitor))
+        self.client.force_login(User.objects.create_user('teacher'))
+        response = self.client.post(reverse('main:monitor_edit', kwargs={'monitor_id': self.monitor.pk}),
+                                    {'query_type': 'worker'})
+        self.assertNotContains(response, f'archive_monitors {self.monitor.pk}')
+        self.assertEqual(MonitorArchive.objects.count(), 1)
+
+    def _rehydrate_behind_a_warm_cache(self, resume: bool):
+        """Rehydrates while another process keeps the archived table, which the refresh does not reach"""
+        MonitorArchiver.archive(self.monitor)
+        MonitorGenerator.gen(self.monitor)
+        key = MonitorGenerator._get_key(self.monitor)
+        stale = caches['monitor_tables'].get(key)
+        self.assertTrue(stale.archived)
+        if resume:
+            self.monitor.is_old = False
+            self.monitor.save()
+        MonitorArchiver.rehydrate(self.monitor)
+        caches['monitor_tables'].set(key, stale)
+
+        submit = Submit.objects.filter(verdict=WA).order_by('index').first()
+        submit.verdict = Submit.OK
+        submit.save()
+        StandingsBuilder.rebuild({(submit.problem_id, submit.personality_id)})
+
+    def assertFresh(self):
+        rows = plain(MonitorGenerator.gen(self.monitor)[0])
+        self.assertNotEqual(rows, self.rows)
+        MonitorGenerator.refresh(self.monitor)
+        self.assertEqual(rows, plain(MonitorGenerator.gen(self.monitor)[0]))
+
+    def test_resumed_monitor_drops_the_stale_archived_table(self):
+        self._rehydrate_behind_a_warm_cache(resume=True)
+        self.assertFresh()
+
+    def test_rehydrated_old_monitor_drops_the_stale_archived_table(self):
+        # rehydrate_monitor without --resume keeps the monitor old
+        self._rehydrate_behind_a_warm_cache(resume=False)
+        self.assertFresh()
+
+
+def split(data: bytes, size: int) -> list[bytes]:
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class JsonArrayStreamTest(SimpleTestCase):
+    def _read(self, chunks) -> (list, JsonArrayStream):
+        stream = JsonArrayStream(chunks, 'result')
+        return list(stream), stream
+
+    def test_items_split_across_chunks(self):
+        result = [{'id': i, 'problem': {'index': 'A'}, 'author': {'members': [{'handle': f'user{i}'}]}} for i in range(20)]
+        data = json.dumps({'status': 'OK', 'result': result}).encode()
+        for size in 1, 7, 64, len(data):
+            items, stream = self._read(split(data, size))
+            self.assertEqual(items, result)
+            self.assertTrue(stream.found)
+
+    def test_rest_of_the_document_is_read(self):
+        data = json.dumps({'status': 'OK', 'result': [1, 2], 'comment': 'x' * 100}).encode()
+        items, stream = self._read(split(data, 16))
+        self.assertEqual(items, [1, 2])
+        self.assertEqual(stream.size, len(data))
+
+    def test_multibyte_characters_split_across_chunks(self):
+        data = json.dumps({'result': [{'name': 'Задача «Ёж»'}, '✓']}, ensure_ascii=False).encode()
+        self.assertEqual(self._read(split(data, 1))[0], [{'name': 'Задача «Ёж»'}, '✓'])
+
+    def test_array_start_split_across_chunks(self):
+        items, stream = self._read([b'{"status": "OK", "res', b'ult"', b' :', b' [', b'1, 2', b']}'])
+        self.assertEqual(items, [1, 2])
+        self.assertTrue(stream.found)
+
+    def test_empty_array(self):
+        items, stream = self._read(split(b'{"status":"OK","result":[]}', 3))
+        self.assertEqual(items, [])
+        self.assertTrue(stream.found)
+
+    def test_error_document_is_parsed_whole(self):
+        items, stream = self._read(split(b'{"status":"FAILED","comment":"contestId: Contest with id 1 not found"}', 5))
+        self.assertEqual(items, [])
+        self.assertFalse(stream.found)
+        self.assertEqual(stream.document['comment'], 'contestId: Contest with id 1 not found')
+
+    def test_html_page_is_malformed(self):
+        with self.assertRaises(ValueError):
+            self._read([b'<html><body>Codeforces is temporarily unavailable</body></html>'])
+
+    def test_truncated_document(self):
+        stream = JsonArrayStream(split(b'{"result":[{"id":1},{"id":2},{"id"', 4), 'result')
+        items = []
+        with self.assertRaises(ValueError):
+            for item in stream:
+                items.append(item)
+        self.assertEqual(items, [{'id': 1}, {'id': 2}])
+
+
+class TableCacheTest(SimpleTestCase):
+    def test_least_recently_used_entries_are_evicted_over_the_cap(self):
+        tables = BoundedMemoryCache('test-bounded', {'OPTIONS': {'MAX_BYTES': 3000}})
+        tables.clear()
+        for key in 'abc':
+            tables.set(key, 'x' * 900)
+        tables.get('a')
+        tables.set('d', 'x' * 900)
+        self.assertEqual([key for key in 'abcd' if tables.get(key) is not None], ['a', 'c', 'd'])
+        self.assertLessEqual(tables.get_size(), 3000)
+
+    def test_oversized_entry_is_kept_alone(self):
+        tables = BoundedMemoryCache('test-oversized', {'OPTIONS': {'MAX_BYTES': 100}})
+        tables.clear()
+        tables.set('a', 'x')
+        tables.set('b', 'x' * 1000)
+        self.assertIsNone(tables.get('a'))
+        self.assertIsNotNone(tables.get('b'))
+
+    def test_tables_are_kept_without_pickling(self):
+        tables = BoundedMemoryCache('test-live', {'OPTIONS': {'MAX_BYTES': 10 ** 6}})
+        tables.clear()
+        state = MonitorGenerator.State()
+        state.table = {(i, 1): TableCell(1, i, TableCell.OK, True, 'Python 3', 15, None) for i in range(10)}
+        with patch('pickle.dumps', side_effect=AssertionError('pickled')):
+            tables.set('a', state)
+            self.assertIs(tables.get('a'), state)
+        self.assertEqual(tables.get_size(), 10 * MonitorGenerator.State.CELL_BYTES)
+
+
+class SharedTableTest(TestCase):
+    def test_table_is_kept_in_the_configured_backend(self):
+        with tempfile.TemporaryDirectory() as location, self.settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'monitor_tables': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }):
+            monitor = create_monitor()
+            add_participants(monitor, 3)
+            rows, _ = MonitorGenerator.gen(monitor)
+
+            state = caches['monitor_tables'].get(f'monitor_table:{monitor.pk}')
+            self.assertEqual(len(state.table), 18)
+            # another process would start from the stored table and only read what changed since
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(plain(MonitorGenerator.gen(monitor)[0]), plain(rows))
+            cells = [q['sql'] for q in queries.captured_queries if 'standingscell' in q['sql']]
+            self.assertIn('updated_at', cells[0])
+
+
+class TokenBucketTest(SimpleTestCase):
+    """The bucket runs on a fake clock, which only sleeping moves forward"""
+
+    def setUp(self):
+        self.now = 0.
+        self.sleeps = []
+        patcher = patch('monitor_website.cf_worker.time', SimpleNamespace(monotonic=lambda: self.now, sleep=self.sleep))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def get_call_times(self, bucket: TokenBucket, calls: int) -> list[float]:
+        times = []
+        for _ in range(calls):
+            bucket.acquire()
+            times.append(self.now)
+        return times
+
+    def test_calls_are_spaced_by_the_rate(self):
+        times = self.get_call_times(TokenBucket(rate=4), 6)
+        self.assertEqual(times, [0., 0.25, 0.5, 0.75, 1., 1.25])
+
+    def test_idle_time_is_saved_up_to_the_capacity(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        self.get_call_times(bucket, 3)
+        self.now = 1000.
+        times = self.get_call_times(bucket, 6)
+        # a long pause gives back only `capacity` calls at once, the rest wait for the rate
+        self.assertEqual(times, [1000.] * 3 + [1000.5, 1001., 1001.5])
+        self.assertEqual(self.sleeps, [0.5] * 3)
+
+
+@override_settings(WORKER_EMBEDDED=0)
+class WorkerTestCase(TestCase):
+    """Worker passes over a generated contest, served by FakeCodeforcesAdapter instead of Codeforces"""
+
+    def setUp(self):
+        self.fake = FakeContest.generate(submissions=120, participants=15, problems=4)
+        self.adapter = FakeCodeforcesAdapter(self.fake)
+        session = requests.Session()
+        session.mount('https://codeforces.com/', self.adapter)
+        for patcher in [patch.object(CodeforcesAPIManager, 'session', session),
+                        patch.object(CodeforcesAPIManager, 'bucket', TokenBucket(1e9, 1e9))]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.monitor = Monitor(human_name='Воркер')
+        self.monitor.save()
+        self.contest = Contest.objects.create(monitor=self.monitor, cf_contest=f'{self.fake.contest_id}')
+        self.worker = CodeforcesWorker(embedded=False)
+
+    def run_pass(self, full_update=False) -> CodeforcesWorker.Fetch:
+        fetch = self.worker._fetch(self.worker._plan_fetch(self.contest, full_update))
+        self.worker._process_contest(fetch)
+        self.contest.refresh_from_db()
+        return fetch
+
+    def get_status_queries(self) -> list[dict]:
+        queries = [params for name, params in self.adapter.queries if name == CodeforcesWorker.SUBMITS_QUERY]
+        self.adapter.queries.clear()
+        return queries
+
+    def assertStored(self, contest: Contest = None, fake: FakeContest = None):
+        """Submits of the contest are exactly what the fake Codeforces has now"""
+        contest, fake = contest or self.contest, fake or self.fake
+        expected = {
+            (submission['id'], member['handle']): CodeforcesWorker._submission_fields(submission)['verdict']
+            for submission in fake.status for member in submission['author']['members']
+        }
+        stored = Submit.objects.filter(contest=contest).values_list('index', 'personality__nickname', 'verdict')
+        self.assertEqual({(index, handle): verdict for index, handle, verdict in stored}, expected)
+
+
+class IngestContextTest(WorkerTestCase):
+    def test_unchanged_submissions_are_skipped_without_writes(self):
+        self.run_pass()
+        self.contest.last_full_update = None
+        with CaptureQueriesContext(connection) as queries:
+            fetch = self.run_pass()
+        self.assertTrue(fetch.full_update)
+        self.assertEqual(fetch.changed, 0)
+        writes = [q['sql'] for q in queries.captured_queries
+                  if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and 'monitor_website_submit' in q['sql']]
+        self.assertEqual(writes, [])
+        self.assertFalse(any(q['sql'].startswith('INSERT INTO "monitor_website_standingscell"')
+                             for q in queries.captured_queries))
+
+    def test_preloaded_window_covers_every_fetched_submission(self):
+        self.run_pass()
+        self.fake.add_submissions(20, testing=8)
+        self.run_pass()
+        self.fake.judge()
+        self.fake.add_submissions(5)
+
+        fetch = self.worker._fetch(self.worker._plan_fetch(self.contest))
+        context = IngestContext(self.contest, since=self.contest.last_submission_time)
+        stored = dict(Submit.objects.filter(contest=self.contest).values_list('index', 'personality_id'))
+        fetched = [submission['id'] for submission in fetch.submissions]
+        self.assertEqual(len(fetched), 13)
+        for index in fetched:
+            if index in stored:
+                self.assertIn((index, stored[index]), context.submits)
+
+
+class FingerprintSkipTest(WorkerTestCase):
+    def test_unchanged_tail_is_skipped(self):
+        self.run_pass()
+        self.run_pass()
+        self.assertEqual((self.contest.processed_cycles, self.contest.skipped_cycles), (2, 0))
+        self.assertNotEqual(self.contest.status_fingerprint, '')
+
+        with CaptureQueriesContext(connection) as queries:
+            fetch = self.run_pass()
+        self.assertEqual(fetch.changed, 0)
+        self.assertEqual((self.contest.processed_cycles, self.contest.skipped_cycles), (2, 1))
+        writes = [q['sql'] for q in queries.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(len(writes), 1)
+        self.assertIn('skipped_cycles', writes[0])
+
+    def test_new_verdicts_of_submissions_being_tested_are_not_skipped(self):
+        self.run_pass()
+        self.fake.add_submissions(5, testing=5)
+        self.run_pass()
+        self.assertEqual(self.run_pass().changed, 0)
+        self.assertEqual((self.contest.processed_cycles, self.contest.skipped_cycles), (2, 1))
+
+        self.fake.judge()
+        fetch = self.run_pass()
+        self.assertEqual(fetch.changed, 5)
+        self.assertEqual((self.contest.processed_cycles, self.contest.skipped_cycles), (3, 1))
+        self.assertStored()
+
+    def test_fingerprint_is_not_used_when_problems_are_reloaded(self):
+        self.run_pass()
+        self.run_pass()
+        fetch = self.run_pass(full_update=True)
+        self.assertIsNone(fetch.fingerprint)
+        self.assertEqual((self.contest.processed_cycles, self.contest.skipped_cycles), (3, 0))
+        self.assertStored()
+
+
+class WorkerFetchTest(WorkerTestCase):
+    def test_first_pass_stores_every_submission(self):
+        fetch = self.run_pass()
+        self.assertTrue(fetch.full_update)
+        self.assertStored()
+        self.assertEqual(self.contest.last_submission_id, self.fake.status[0]['id'])
+        self.assertIsNotNone(self.contest.last_full_update)
+        self.assertEqual(self.contest.problem_set.count(), 4)
+
+    def test_watermark_stays_below_submissions_being_tested(self):
+        self.run_pass()
+        self.fake.add_submissions(10, testing=3)
+        self.run_pass()
+        self.assertStored()
+        testing = min(s['id'] for s in self.fake.status if s['verdict'] == 'TESTING')
+        self.assertEqual(self.contest.last_submission_id, testing - 1)
+
+        self.fake.judge()
+        self.get_status_queries()
+        self.run_pass()
+        self.assertStored()
+        self.assertEqual(self.contest.last_submission_id, self.fake.status[0]['id'])
+        self.assertEqual([query['from'] for query in self.get_status_queries()], ['1'])
+
+    @patch.object(CodeforcesWorker, 'STATUS_PAGE_SIZE', 10)
+    def test_incremental_pass_pages_down_to_the_watermark(self):
+        self.run_pass()
+        self.assertEqual(len(self.get_status_queries()), 13)
+
+        self.fake.add_submissions(25)
+        fetch = self.run_pass()
+        self.assertFalse(fetch.full_update)
+        self.assertEqual([(query['from'], query['count']) for query in self.get_status_queries()],
+                         [('1', '10'), ('11', '10'), ('21', '10')])
+        self.assertEqual(fetch.changed, 25)
+        self.assertStored()
+
+    @patch.object(CodeforcesWorker, 'STATUS_PAGE_SIZE', 10)
+    @patch.object(CodeforcesWorker, 'PAGE_QUEUE_SIZE', 1)
+    def test_full_pass_is_streamed_through_a_bounded_queue(self):
+        fetch = self.worker._fetch(self.worker._plan_fetch(self.contest))
+        time.sleep(0.2)
+        # one page in the queue and one waiting to be put, nothing more is downloaded before ingest
+        early = len(self.get_status_queries())
+        self.assertLessEqual(early, 2)
+        self.worker._process_contest(fetch)
+        self.assertEqual(early + len(self.get_status_queries()), 13)
+        self.assertStored()
+
+    def test_error_in_the_middle_of_a_full_pass_reaches_the_ingest_thread(self):
+        def broken(worker, contest, watermark, page_size, stats):
+            yield from self.fake.status[:5]
+            raise requests.ConnectionError()
+
+        with patch.object(CodeforcesWorker, '_iter_new_submissions', broken):
+            with self.assertRaises(requests.ConnectionError):
+                self.run_pass()
+
+    def test_first_incremental_page_is_sized_by_submission_rate(self):
+        self.run_pass()
+        self.contest.submission_rate = 5
+        self.contest.last_status_update = timezone.now() - timezone.timedelta(minutes=2)
+        self.contest.save()
+        self.fake.add_submissions(10)
+        self.get_status_queries()
+        self.adapter.replies.clear()
+
+        fetch = self.run_pass()
+        self.assertEqual(fetch.changed, 10)
+        self.assertEqual([(query['from'], query['count']) for query in self.get_status_queries()],
+                         [('1', f'{CodeforcesWorker.MIN_PAGE_SIZE + 20}')])
+        # pages are read to the end, so their connections go back to the pool
+        for reply in self.adapter.replies:
+            self.assertEqual(reply.raw.tell(), len(reply.raw.getvalue()))
+        self.assertStored()
+
+    def test_api_calls_are_stored_on_release(self):
+        fetch = self.run_pass()
+        self.assertEqual(fetch.stats.calls, self.adapter.calls)
+        self.worker._release(self.contest, [], fetch.stats)
+        self.contest.refresh_from_db()
+        self.assertEqual(self.contest.api_calls, self.adapter.calls)
+        self.assertGreater(self.contest.api_wire_bytes, 0)
+
+        self.client.force_login(User.objects.create_user('teacher'))
+        self.assertContains(self.client.get(reverse('main:logs')), f'<td class="font-monospace">{self.fake.contest_id}</td>')
+
+    def test_rejudge_below_the_watermark_waits_for_the_hourly_full_pass(self):
+        self.run_pass()
+        old = self.fake.status[-1]
+        verdict = Submit.objects.get(contest=self.contest, index=old['id']).verdict
+        old['verdict'] = 'OK' if old['verdict'] != 'OK' else 'WRONG_ANSWER'
+
+        self.assertFalse(self.run_pass().full_update)
+        self.assertEqual(Submit.objects.get(contest=self.contest, index=old['id']).verdict, verdict)
+
+        self.contest.last_full_update = timezone.now() - CodeforcesWorker.FULL_UPDATE_DELTA - timezone.timedelta(minutes=1)
+        self.contest.save()
+        fetch = self.run_pass()
+        self.assertTrue(fetch.full_update)
+        self.assertEqual(fetch.changed, 1)
+        self.assertStored()
+
+
+class WorkerErrorTest(WorkerTestCase):
+    def test_unavailable_page_marks_the_contest(self):
+        self.adapter.error_rate = 1
+        self.run_pass()
+        self.assertEqual(self.contest.error_text, 'Codeforces services unavailable')
+        self.assertEqual(self.contest.fail_count, 0)
+
+    def test_call_limit_reply_marks_the_contest(self):
+        self.run_pass()
+        self.fake.add_submissions(5)
+        self.adapter.rate_limit_rate = 1
+        self.run_pass()
+        self.assertEqual(self.contest.error_text, 'Call limit exceeded')
+
+    def test_unavailable_page_while_streaming_the_status(self):
+        self.run_pass()
+        self.fake.add_submissions(5)
+        self.adapter.error_rate = 1
+        self.run_pass()
+        self.assertEqual(self.contest.error_text, 'Codeforces services unavailable')
+        self.assertEqual(Submit.objects.filter(contest=self.contest).count(), 120)
+
+    @patch.object(CodeforcesWorker, 'NAP_SECONDS', 0)
+    def test_connection_errors_back_off_the_contest(self):
+        self.contest.last_ping = timezone.now()
+        self.contest.save()
+        self.adapter.connection_error_rate = 1
+        for fail_count in 1, 2:
+            self.worker._iters = 1
+            self.worker.start()
+            self.contest.refresh_from_db()
+            self.assertEqual(self.contest.fail_count, fail_count)
+            self.assertIsNone(self.contest.error_text)
+            self.assertFalse(self.contest.is_leased())
+
+        self.adapter.connection_error_rate = 0
+        self.worker._iters = 1
+        self.worker.start()
+        self.contest.refresh_from_db()
+        self.assertEqual(self.contest.fail_count, 0)
+        self.assertIsNotNone(self.contest.last_status_update)
+        self.assertStored()
+
+
+class WorkerLoopTest(WorkerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_fake = FakeContest.generate(submissions=80, participants=10, problems=3, contest_id=2, seed=1)
+        for submission in self.other_fake.status:  # submission ids are unique across Codeforces
+            submission['id'] += 10 ** 6
+        self.adapter.contests['2'] = self.other_fake
+        self.other = Contest.objects.create(monitor=self.monitor, cf_contest='2')
+        Contest.objects.update(last_ping=timezone.now())
+
+    def test_claimed_contests_are_leased_once(self):
+        first = self.worker._claim_contests(1)
+        self.assertEqual(len(first), 1)
+        self.assertTrue(Contest.objects.get(pk=first[0].pk).is_leased())
+
+        second = self.worker._claim_contests(5)
+        self.assertEqual({contest.pk for contest in first + second}, {self.contest.pk, self.other.pk})
+        self.assertEqual(self.worker._claim_contests(5), [])
+
+    def test_leases_are_released_when_the_worker_is_stopped(self):
+        fetched = threading.Event()
+        self.addCleanup(fetched.set)
+
+        def fetch(worker, fetch):
+            fetched.wait(5)
+            return fetch
+
+        # SIGTERM handler of run_worker exits while both contests are being fetched
+        with patch.object(CodeforcesWorker, '_fetch', fetch), \
+                patch('monitor_website.cf_worker.wait', side_effect=SystemExit):
+            with self.assertRaises(SystemExit):
+                self.worker.start()
+        self.assertFalse(Contest.objects.filter(leased_until__isnull=False).exists())
+
+    @patch.object(CodeforcesWorker, 'NAP_SECONDS', 0)
+    @patch.object(CodeforcesWorker, 'FETCH_THREADS', 2)
+    def test_contests_are_fetched_side_by_side(self):
+        # neither fetch returns before the other one has started
+        both_started = threading.Barrier(2, timeout=5)
+        fetch = CodeforcesWorker._fetch
+
+        def fetch_together(worker, plan):
+            both_started.wait()
+            return fetch(worker, plan)
+
+        self.worker._iters = 3
+        with patch.object(CodeforcesWorker, '_fetch', fetch_together):
+            self.worker.start()
+
+        for contest, fake in (self.contest, self.fake), (self.other, self.other_fake):
+            contest.refresh_from_db()
+            self.assertStored(contest, fake)
+            self.assertIsNotNone(contest.last_status_update)
+            self.assertFalse(contest.is_leased())
+        self.assertEqual(Problem.objects.filter(contest=self.other).count(), 3)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'query plans are checked on PostgreSQL')
+class QueryPlanTest(TestCase):
+    """Hot queries of the worker and the monitor keep using indexes on tables big enough for the planner to care"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.monitor = create_monitor(contests=5, problems=10)
+        add_participants(cls.monitor, 300)
+        cls.contest = cls.monitor.contest_set.first()
+        cls.pair = StandingsCell.objects.filter(problem__contest=cls.contest).values_list('problem_id', 'personality_id')[0]
+
+        old = timezone.now() - timezone.timedelta(days=30)
+        others = [Monitor.objects.create(human_name=f'Старый {i}') for i in range(50)]
+        Contest.objects.bulk_create([
+            Contest(monitor=others[i % len(others)], cf_contest=f'{1000 + i}', last_ping=old) for i in range(5000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertNoSeqScan(self, queryset, table):
+        nodes = [json.loads(queryset.explain(format='json'))[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            self.assertFalse(node['Node Type'] == 'Seq Scan' and node.get('Relation Name') == table,
+                             f'{table} is scanned sequentially:\n{queryset.explain()}')
+            nodes.extend(node.get('Plans', []))
+
+    def test_worker_claim(self):
+        self.assertNoSeqScan(CodeforcesWorker.get_claimable(timezone.now()), 'monitor_website_contest')
+
+    def test_ingest_submits_since_watermark(self):
+        since = timezone.now() - timezone.timedelta(hours=1)
+        self.assertNoSeqScan(IngestContext.get_submits(self.contest, since), 'monitor_website_submit')
+
+    def test_standings_rebuild(self):
+        self.assertNoSeqScan(StandingsBuilder.get_submits({self.pair}), 'monitor_website_submit')
+
+    def test_changed_cells(self):
+        # the cells were all written by setUpTestData, a poll after it reads none of them
+        self.assertNoSeqScan(MonitorGenerator.get_changed_cells(self.monitor, timezone.now()), 'monitor_website_standingscell')
@@ -21,6 +21,9 @@ urlpatterns = [
     path('monitor/<int:monitor_id>/edit/remove_all', views.edit_remove_all_people, name="remove_all_people"),
 
     path('logs/', views.worker_logs, name='logs'),
+    path('logs/queue/', views.worker_queue, name='queue'),
     path('hidden/<int:monitor_id>/card/', views.card_inside, name='card_inside'),
-    path('hidden/<int:monitor_id>/', views.monitor_inside, name='monitor_inside')
+    path('hidden/<int:monitor_id>/', views.monitor_inside, name='monitor_inside'),
+    path('hidden/<int:monitor_id>/diff/', views.monitor_diff, name='monitor_diff'),
+    path('hidden/<int:monitor_id>/events/', views.monitor_events, name='monitor_events')
 ]
\ No newline at end of file
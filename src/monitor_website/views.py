@@ -1,15 +1,26 @@
 import django.http as http
+from asgiref.sync import sync_to_async
+from django.core.cache import cache, caches
+from django.core.handlers.asgi import ASGIRequest
 from django.db import transaction
+from django.db.models import Sum
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
 from django.views.generic import CreateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 
 import monitor_website.models as models
 import monitor_website.forms as forms
 
-from monitor_website.cf_worker import CodeforcesWorker, ping
-from .monitor_gen import MonitorGenerator
+from monitor_website.cf_worker import CodeforcesWorker, ping, wake_worker
+from .archive import MonitorArchiver
+from .events import MonitorEvents
+from .ingest import StandingsBuilder
+from .monitor_gen import MonitorGenerator, StandingsSnapshot
+from .scheduler import ContestScheduler
 
 
 def auth_or_404(function):
@@ -33,25 +44,139 @@ class NewMonitorView(LoginRequiredMixin, CreateView):
         return context
 
 
+MONITOR_CACHE_SECONDS = 10 * 60
+MONITOR_DIFF_LIMIT = 300
+
+
+def _get_contest_headers(contests: list[models.Contest], problem_list: list[models.Problem]) -> list[dict]:
+    """Contests with their problems and links as plain data, so _monitor.html makes no queries"""
+    problems = {}
+    for problem in problem_list:
+        problems.setdefault(problem.contest_id, []).append({
+            'index': problem.index,
+            'name': problem.name,
+            'difficulty': problem.difficulty,
+            'url': problem.get_cf_url(),
+        })
+    return [{
+        'human_name': contest.human_name,
+        'url': contest.get_cf_url(),
+        'problems': problems.get(contest.pk, []),
+    } for contest in contests]
+
+
+def _get_snapshot_key(monitor: models.Monitor, version: str):
+    return f'monitor_snapshot:{monitor.pk}:{version}'
+
+
+def _gen_monitor(monitor: models.Monitor, version: str):
+    """Generates the table and keeps its snapshot, which later polls are compared against.
+    Snapshots share the `monitor_tables` cache with the tables, so a poll may be answered by any process"""
+    personalities, problem_list = MonitorGenerator.gen(monitor)
+    snapshot = StandingsSnapshot(personalities, problem_list)
+    caches[MonitorGenerator.CACHE].set(_get_snapshot_key(monitor, version), snapshot, MONITOR_CACHE_SECONDS)
+    return personalities, problem_list, snapshot
+
+
 def monitor_inside(request: http.HttpRequest, monitor_id):
+    """Unchanged monitors are answered with 304 or with the fragment rendered for an earlier poll"""
     monitor = get_object_or_404(models.Monitor, pk=monitor_id)
     ping(monitor)
-    personalities, problem_list = MonitorGenerator.gen(monitor)
 
-    return render(request, '_monitor.html', {
-        'monitor': monitor,
-        'total_problems': len(problem_list),
-        'personalities': personalities,
+    viewer = 'auth' if request.user.is_authenticated else 'anon'
+    version = MonitorGenerator.get_version(monitor)
+    etag = f'"{version}-{viewer}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+
+    key = f'monitor_inside:{monitor.pk}:{viewer}:{version}'
+    content = cache.get(key)
+    if content is None:
+        personalities, problem_list, _ = _gen_monitor(monitor, version)
+        contests = list(monitor.contest_set.all())
+        content = render_to_string('_monitor.html', {
+            'contests': _get_contest_headers(contests, problem_list),
+            'last_update': monitor.last_update(contests),
+            'total_problems': len(problem_list),
+            'personalities': personalities,
+        }, request)
+        cache.set(key, content, MONITOR_CACHE_SECONDS)
+
+    response = http.HttpResponse(content)
+    response['ETag'] = etag
+    response['X-Monitor-Version'] = version
+    # the browser keeps the fragment but asks whether it is still current on every poll
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+async def monitor_events(request: http.HttpRequest, monitor_id):
+    """Server-sent `changed` events for the monitor page, which then asks monitor_diff what changed"""
+    if not isinstance(request, ASGIRequest):
+        # a stream would hold a WSGI worker for good, the page keeps polling instead
+        return http.HttpResponse(status=204)
+    monitor = await sync_to_async(get_object_or_404)(models.Monitor, pk=monitor_id)
+    response = http.StreamingHttpResponse(MonitorEvents.stream(monitor, ping), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx would otherwise hold the events in its buffer
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def monitor_diff(request: http.HttpRequest, monitor_id):
+    """Cells and places changed since the version the client shows.
+    Answers `full` when the client has to load the whole fragment from monitor_inside instead"""
+    monitor = get_object_or_404(models.Monitor, pk=monitor_id)
+    ping(monitor)
+
+    version = MonitorGenerator.get_version(monitor)
+    since = request.GET.get('since', '')
+    if since == version:
+        return http.JsonResponse({'version': version, 'cells': [], 'ranks': []})
+
+    snapshots = caches[MonitorGenerator.CACHE]
+    old = snapshots.get(_get_snapshot_key(monitor, since))
+    if old is None:
+        return http.JsonResponse({'version': version, 'full': True})
+    new = snapshots.get(_get_snapshot_key(monitor, version))
+    if new is None:
+        _, _, new = _gen_monitor(monitor, version)
+
+    diff = old.diff(new)
+    if diff is None or sum(map(len, diff)) > MONITOR_DIFF_LIMIT:
+        return http.JsonResponse({'version': version, 'full': True})
+
+    cells, ranks = diff
+    return http.JsonResponse({
+        'version': version,
+        'last_update': render_to_string('_last_update.html', {'last_update': monitor.last_update()}),
+        'cells': [
+            [pk, column, render_to_string('_monitor_cell.html', {
+                'penalty': penalty,
+                'link': link,
+                'submit': submit,
+            }, request)]
+            for pk, column, (penalty, link, submit) in cells
+        ],
+        'ranks': [[pk, *rank] for pk, rank in ranks],
+        'order': new.order if ranks else None,
     })
 
 
 def monitor_page(request: http.HttpRequest, monitor_id):
     monitor = get_object_or_404(models.Monitor, pk=monitor_id)
     ping(monitor)
+    contests = list(monitor.contest_set.all())
+    problem_list = MonitorGenerator.get_problems(monitor)
 
     return render(request, "monitor.html", {
         'title': monitor.human_name,
         'monitor': monitor,
+        'has_errors': any(contest.error_text is not None for contest in contests),
+        'contests': _get_contest_headers(contests, problem_list),
+        'total_problems': len(problem_list),
     })
 
 
@@ -64,6 +189,8 @@ def monitor_edit(request: http.HttpRequest, monitor_id):
     contests = monitor.contest_set.all()
 
     create_contest_form = forms.CreateContestForm()
+    poll_form, poll_contest = None, None
+    archive_skipped = False
 
     if request.method == 'POST' and 'query_type' in request.POST:
         q_type = request.POST['query_type']
@@ -79,6 +206,28 @@ def monitor_edit(request: http.HttpRequest, monitor_id):
         elif q_type == 'worker':
             monitor.is_old = not ('is_set' in post and post['is_set'] == 'on')
             monitor.save()
+            # submits of a monitor that is not updated any more are kept in the archive, out of the hot tables
+            if monitor.is_old:
+                try:
+                    MonitorArchiver.archive(monitor)
+                except MonitorArchiver.ContestsLeased:
+                    archive_skipped = True
+            else:
+                MonitorArchiver.rehydrate(monitor)
+        elif q_type == 'ingest':
+            is_set = 'is_set' in post and post['is_set'] == 'on'
+            monitor.ingest = models.Monitor.SUMMARY_INGEST if is_set else models.Monitor.FULL_INGEST
+            monitor.save()
+            if monitor.ingest == models.Monitor.SUMMARY_INGEST:
+                StandingsBuilder.prune_monitor(monitor)
+        elif q_type == 'poll':
+            poll_contest = get_object_or_404(contests, cf_contest=post.get('contest'))
+            poll_form = forms.ContestPollForm(post)
+            if poll_form.is_valid():
+                data = poll_form.cleaned_data
+                poll_contest.min_poll_interval = data['min_seconds'] and timezone.timedelta(seconds=data['min_seconds'])
+                poll_contest.max_poll_interval = data['max_seconds'] and timezone.timedelta(seconds=data['max_seconds'])
+                poll_contest.save(update_fields=['min_poll_interval', 'max_poll_interval'])
         elif q_type == 'create':
             create_contest_form = forms.CreateContestForm(post)
             if create_contest_form.is_valid():
@@ -89,7 +238,9 @@ def monitor_edit(request: http.HttpRequest, monitor_id):
                     models.Contest.objects.create(
                         cf_contest=data['cf_contest'],
                         monitor=monitor,
-                        human_name=data['human_name']
+                        human_name=data['human_name'],
+                        # the monitor may have been pinged just now, before the contest existed
+                        last_ping=timezone.now()
                     )
                     create_contest_form = forms.CreateContestForm()
         # pers
@@ -106,6 +257,10 @@ def monitor_edit(request: http.HttpRequest, monitor_id):
         'monitor': monitor,
         'contests': contests,
         'creation_form': create_contest_form,
+        'archive_skipped': archive_skipped,
+        'poll_form': poll_form,
+        'poll_contest': poll_contest and poll_contest.pk,
+        'poll_defaults': (ContestScheduler.MIN_INTERVAL.seconds, ContestScheduler.MAX_INTERVAL.seconds),
         'personals': sorted(list(monitor.personality_set.all()), key=lambda x: x.nickname.lower()),
         'w_status': CodeforcesWorker.current_status
     })
@@ -210,7 +365,7 @@ def move_down_monitor(request, monitor_id):
 def monitors_list_page(request: http.HttpRequest, render_admin=False):
     if render_admin and not request.user.is_superuser:
         render_admin = None
-    CodeforcesWorker()
+    wake_worker()
     return render(request, "home.html", {
         'render_admin': render_admin,
         'title': "Мониторы",
@@ -227,10 +382,22 @@ def monitors_index_page(request: http.HttpRequest):
 def worker_logs(request: http.HttpRequest):
     if not request.user.is_authenticated:
         raise http.Http404()
-    CodeforcesWorker()
+    wake_worker()
     return render(request, 'worker_logs.html', {
         'title': 'Логи воркера',
-        'logs': sorted(CodeforcesWorker.worker_logs.copy(), key=lambda x: x.time, reverse=True)
+        'logs': models.WorkerLog.objects.all()[:CodeforcesWorker.MAX_LOGS],
+        'api_stats': models.Contest.objects.filter(api_calls__gt=0).order_by('-api_wire_bytes'),
+        'cycles': models.Contest.objects.aggregate(processed=Sum('processed_cycles'), skipped=Sum('skipped_cycles')),
+    })
+
+
+def worker_queue(request: http.HttpRequest):
+    if not request.user.is_authenticated:
+        raise http.Http404()
+    contests = list(models.Contest.objects.filter(monitor__is_old=False).select_related('monitor'))
+    return render(request, 'worker_queue.html', {
+        'title': 'Очередь воркера',
+        'plans': ContestScheduler.plan(contests),
     })
 
 
@@ -239,5 +406,5 @@ def card_inside(request, monitor_id):
     contest = _edit_get_contest(request, monitor_id, contest_id)
     return render(request, '__card_inside.html', {
         "contest": contest,
-        "w_status": CodeforcesWorker.current_status
+        "w_status": CodeforcesWorker.get_status(contest)
     })
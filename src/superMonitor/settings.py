@@ -15,6 +15,9 @@ DEBUG = int(os.environ.get('DEBUG', '0'))
 
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '127.0.0.1').split()
 
+# Set to 0 when the Codeforces worker runs as `manage.py run_worker` instead of a thread inside web processes
+WORKER_EMBEDDED = int(os.environ.get('WORKER_EMBEDDED', '1'))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -75,6 +78,31 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Standings tables of MonitorGenerator. The default keeps them in each process with LRU eviction under a memory cap;
+# point MONITOR_CACHE_BACKEND at FileBasedCache, PyMemcacheCache or RedisCache to share one table between processes
+MONITOR_CACHE_BACKEND = os.environ.get('MONITOR_CACHE_BACKEND', 'monitor_website.table_cache.BoundedMemoryCache')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'monitor_tables': {
+        'BACKEND': MONITOR_CACHE_BACKEND,
+        'LOCATION': os.environ.get('MONITOR_CACHE_LOCATION', 'monitor_tables'),
+        'TIMEOUT': int(os.environ.get('MONITOR_CACHE_TIMEOUT', 6 * 60 * 60)),
+        'OPTIONS': {},
+    },
+}
+# cache servers get OPTIONS as client arguments, so the limits only apply to local and file backends
+if MONITOR_CACHE_BACKEND.endswith(('BoundedMemoryCache', 'LocMemCache', 'FileBasedCache')):
+    CACHES['monitor_tables']['OPTIONS']['MAX_ENTRIES'] = int(os.environ.get('MONITOR_CACHE_ENTRIES', '100'))
+if MONITOR_CACHE_BACKEND.endswith('BoundedMemoryCache'):
+    CACHES['monitor_tables']['OPTIONS']['MAX_BYTES'] = int(os.environ.get('MONITOR_CACHE_MAX_MB', '256')) * 1024 * 1024
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
 